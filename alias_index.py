@@ -0,0 +1,96 @@
+"""
+Precomputed fuzzy-match index for series alias resolution.
+
+Worksheet titles and saved aliases are normalized and token-sorted once when
+the index is built. A lookup only scores the entries that share a token or a
+character trigram with the query, instead of every worksheet title.
+"""
+import logging
+from collections import defaultdict
+
+from thefuzz import fuzz, utils
+
+logger = logging.getLogger(__name__)
+
+SUGGESTION_LIMIT = 3
+SUGGESTION_CUTOFF = 70
+NGRAM_SIZE = 3
+
+
+def normalize(text: str) -> str:
+    """Lowercased, punctuation-free, token-sorted form used by fuzz.token_sort_ratio."""
+    return " ".join(sorted(utils.full_process(text, force_ascii=True).split()))
+
+
+def _blocking_keys(key: str) -> set[str]:
+    keys = set()
+    for token in key.split():
+        keys.add(token)
+        padded = f" {token} "
+        for i in range(len(padded) - NGRAM_SIZE + 1):
+            keys.add(padded[i:i + NGRAM_SIZE])
+    return keys
+
+
+class AliasIndex:
+    def __init__(self, entries: list[tuple[str, str]]):
+        """`entries` are (searchable text, worksheet title) pairs."""
+        self.keys: list[str] = []
+        self.titles: list[str] = []
+        self._postings: dict[str, list[int]] = defaultdict(list)
+        seen = set()
+        for text, title in entries:
+            key = normalize(text)
+            if not key or (key, title) in seen:
+                continue
+            seen.add((key, title))
+            entry_id = len(self.keys)
+            self.keys.append(key)
+            self.titles.append(title)
+            for block in _blocking_keys(key):
+                self._postings[block].append(entry_id)
+
+    def suggest(self, name: str, limit: int = SUGGESTION_LIMIT, cutoff: int = SUGGESTION_CUTOFF) -> list[tuple[str, int]]:
+        """Return up to `limit` (worksheet title, score) pairs scoring at least `cutoff`, best first."""
+        query = normalize(name)
+        if not query:
+            return []
+        candidates = set()
+        for block in _blocking_keys(query):
+            candidates.update(self._postings.get(block, ()))
+        best: dict[str, int] = {}
+        for entry_id in candidates:
+            # Both sides are already token-sorted, so this equals fuzz.token_sort_ratio.
+            score = fuzz.ratio(query, self.keys[entry_id])
+            title = self.titles[entry_id]
+            if score >= cutoff and score > best.get(title, -1):
+                best[title] = score
+        ranked = sorted(best.items(), key=lambda item: (-item[1], item[0]))
+        logger.debug('Scored %s of %s entries for "%s": %s', len(candidates), len(self.keys), name, ranked[:limit])
+        return ranked[:limit]
+
+
+_index: AliasIndex | None = None
+_signature: tuple | None = None
+
+
+def get_index(titles: list[str], aliases: list[tuple[str, str]]) -> AliasIndex:
+    """
+    Return the index over worksheet `titles` and (sheet_name, alias) pairs,
+    rebuilding it only when either source changed since the last build.
+    """
+    global _index, _signature
+    signature = (tuple(titles), tuple(sorted(aliases)))
+    if _index is None or signature != _signature:
+        known_titles = set(titles)
+        entries = [(title, title) for title in titles]
+        entries += [(alias, sheet_name) for sheet_name, alias in aliases if sheet_name in known_titles]
+        _index = AliasIndex(entries)
+        _signature = signature
+        logger.info('Built alias index with %s entries', len(_index.keys))
+    return _index
+
+
+def suggest(name: str, titles: list[str], aliases: list[tuple[str, str]], limit: int = SUGGESTION_LIMIT) -> list[str]:
+    """Worksheet titles most likely meant by `name`, best first."""
+    return [title for title, _ in get_index(titles, aliases).suggest(name, limit=limit)]
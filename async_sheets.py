@@ -0,0 +1,80 @@
+"""
+Async facade over the spreadsheet module.
+
+gspread is synchronous, so every call is pushed onto a dedicated thread pool,
+bounded by a concurrency limit and a per-call timeout. The event loop never
+waits on Sheets I/O directly.
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import gspread
+
+import sheets_scheduler
+import spreadsheet
+
+logger = logging.getLogger(__name__)
+
+MAX_WORKERS = int(os.getenv("SHEETS_MAX_WORKERS", "4"))
+MAX_CONCURRENCY = int(os.getenv("SHEETS_MAX_CONCURRENCY", str(MAX_WORKERS)))
+CALL_TIMEOUT = float(os.getenv("SHEETS_CALL_TIMEOUT", "30"))
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="sheets")
+_semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+
+
+def _release(future):
+    _semaphore.release()
+    if not future.cancelled():
+        # Mark the exception as retrieved for calls that already timed out.
+        future.exception()
+
+
+def _call_in_lane(lane: int, call):
+    with sheets_scheduler.priority(lane):
+        return call()
+
+async def run(func, *args, timeout: float | None = CALL_TIMEOUT, priority: int = sheets_scheduler.USER, **kwargs):
+    """
+    Run a blocking spreadsheet call on the Sheets thread pool, with its Sheets
+    requests scheduled in the given priority lane.
+    The concurrency slot is held until the worker thread actually finishes,
+    so calls that time out still count against the limit.
+    Raises asyncio.TimeoutError if the call takes longer than `timeout`; the
+    worker keeps running, so callers whose writes must not land late pass
+    timeout=None to wait for it.
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(_call_in_lane, priority, functools.partial(func, *args, **kwargs))
+    await _semaphore.acquire()
+    try:
+        # Carry the caller's context (update trace) into the worker thread.
+        future = loop.run_in_executor(_executor, contextvars.copy_context().run, call)
+    except BaseException:
+        _semaphore.release()
+        raise
+    future.add_done_callback(_release)
+    try:
+        return await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.warning('Sheets call %s timed out after %ss', getattr(func, "__name__", func), timeout)
+        raise
+
+def describe_api_error(error: gspread.exceptions.APIError) -> str:
+    """User-facing explanation of a Sheets API error that survived the scheduler's retries."""
+    code = sheets_scheduler.status_code(error)
+    if code == 429:
+        return "Google Sheets quota is used up right now. Please try again in a minute."
+    if code is not None and code >= 500:
+        return "Google Sheets is having trouble right now. Please try again later."
+    return f"Google Sheets rejected the request ({code})."
+
+async def worksheet_exists(sheet_title: str) -> bool:
+    return await run(spreadsheet.worksheet_exists, sheet_title)
+
+async def get_all_worksheet_titles() -> list[str]:
+    return await run(spreadsheet.get_all_worksheet_titles)
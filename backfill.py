@@ -0,0 +1,175 @@
+"""
+Channel-history backfill.
+
+Status messages from a time range are re-parsed with the live grammar and
+collapsed to the latest state per (series, chapter, task). That state is
+diffed against one read of the affected worksheets, and the differences are
+written with a few spreadsheet-wide batch requests. Series aliases and
+scannames are taken from the database only; anything unknown is reported
+instead of prompting.
+"""
+import asyncio
+import datetime
+import logging
+from typing import NamedTuple
+
+import async_sheets
+import database
+import locks
+import mirror
+import outbox
+import sheets_scheduler
+import spreadsheet
+import status_parser
+
+logger = logging.getLogger(__name__)
+
+# Example lines shown per report section.
+REPORT_EXAMPLES = 15
+
+
+class TaskState(NamedTuple):
+    sheet_title: str
+    chapter_value: str
+    task: str
+    user_name: str
+    status: str
+
+
+class Report:
+    """What a backfill found, and what it wrote or would write."""
+
+    def __init__(self):
+        self.messages = 0
+        self.updates = 0
+        self.unknown_series: dict[str, int] = {}
+        self.unknown_users: dict[str, int] = {}
+        self.writes: list[str] = []
+        self.up_to_date = 0
+        self.conflicts: list[str] = []
+        self.missing: list[str] = []
+        self.requests = 0
+
+    def lines(self, dry_run: bool) -> list[str]:
+        lines = [
+            f"Scanned {self.messages} messages with {self.updates} status updates.",
+            f"{'Would write' if dry_run else 'Wrote'} {len(self.writes)} task updates"
+            + ("." if dry_run else f" in {self.requests} requests.")
+            + f" {self.up_to_date} already up to date.",
+        ]
+        sections = [
+            ("To write" if dry_run else "Written", self.writes),
+            ("Slots taken by someone else (skipped)", self.conflicts),
+            ("Chapter or task not on the sheet", self.missing),
+            ("Unknown series", [f"{name} ({count}x)" for name, count in self.unknown_series.items()]),
+            ("Unknown users", [f"{name} ({count}x)" for name, count in self.unknown_users.items()]),
+        ]
+        for title, items in sections:
+            if not items:
+                continue
+            lines.append(f"**{title}** ({len(items)}):")
+            lines += [f"- {item}" for item in items[:REPORT_EXAMPLES]]
+            if len(items) > REPORT_EXAMPLES:
+                lines.append(f"- ... and {len(items) - REPORT_EXAMPLES} more")
+        return lines
+
+
+async def collect(channel, after: datetime.datetime, before: datetime.datetime | None, report: Report) -> dict[tuple, TaskState]:
+    """Latest state per lock key of every status update posted in `channel` between `after` and `before`."""
+    states: dict[tuple, TaskState] = {}
+    async for message in channel.history(limit=None, after=after, before=before, oldest_first=True):
+        if message.author.bot:
+            continue
+        report.messages += 1
+        updates = status_parser.parse(message.content)
+        if not updates:
+            continue
+        report.updates += len(updates)
+        user_name = database.get_user_scannname(message.author.name)
+        if user_name is None:
+            report.unknown_users[message.author.name] = report.unknown_users.get(message.author.name, 0) + len(updates)
+            continue
+        for data in updates:
+            sheet_title = database.get_series_by_name(data["Name"])
+            if sheet_title is None:
+                report.unknown_series[data["Name"]] = report.unknown_series.get(data["Name"], 0) + 1
+                continue
+            key = locks.task_key(sheet_title, spreadsheet.normalize_chapter(data["Chapter Number"]), data["Task"])
+            # Oldest first, so later messages overwrite earlier ones.
+            states[key] = TaskState(sheet_title, data["Chapter Number"], data["Task"], user_name, data["Status"])
+    return states
+
+
+def _chapter_rows(rows: list[list[str]]) -> dict[str, int]:
+    chapters = {}
+    for row_idx, row in enumerate(rows, start=1):
+        key = spreadsheet.normalize_chapter(row[0]) if row else ""
+        if key:
+            chapters.setdefault(key, row_idx)
+    return chapters
+
+
+def _cell(row: list[str], col: int) -> str:
+    return str(row[col - 1]).strip() if col <= len(row) else ""
+
+
+def plan(states: dict[tuple, TaskState], report: Report) -> dict[str, list[tuple[int, int, str]]]:
+    """
+    Read the affected worksheets in one request and return the (row, col, value)
+    cells per worksheet that bring them in line with `states`. Blocking.
+    """
+    contents = spreadsheet.read_worksheets(sorted({state.sheet_title for state in states.values()}))
+    sheets = {}
+    for title, rows in contents.items():
+        layout = spreadsheet.parse_task_layout(rows[1] if len(rows) > 1 else [], rows[2] if len(rows) > 2 else [])
+        sheets[title] = (rows, layout, _chapter_rows(rows))
+
+    cells: dict[str, list[tuple[int, int, str]]] = {}
+    for (_, chapter_key, task_key), state in states.items():
+        label = f"{state.sheet_title} ch {chapter_key} {state.task}"
+        rows, layout, chapters = sheets.get(state.sheet_title, ([], {}, {}))
+        row_idx = chapters.get(chapter_key)
+        cols = layout.get(task_key)
+        if row_idx is None or cols is None:
+            report.missing.append(label)
+            continue
+        name_cols, status_col = cols
+        row = rows[row_idx - 1]
+        names = [_cell(row, col) for col in name_cols]
+        current_status = _cell(row, status_col)
+        if state.user_name.lower() in (name.lower() for name in names):
+            if current_status.lower() == state.status.lower():
+                report.up_to_date += 1
+                continue
+            update = [(row_idx, status_col, state.status)]
+        else:
+            empty = next((col for col, name in zip(name_cols, names) if not name), None)
+            if empty is None:
+                report.conflicts.append(f"{label}: {state.user_name} {state.status}, sheet has {', '.join(names)}")
+                continue
+            update = [(row_idx, empty, state.user_name), (row_idx, status_col, state.status)]
+        cells.setdefault(state.sheet_title, []).extend(update)
+        report.writes.append(f"{label}: {state.user_name} {state.status}" + (f" (was {current_status})" if current_status else ""))
+    return cells
+
+
+async def backfill(channel, after: datetime.datetime, before: datetime.datetime | None = None, dry_run: bool = True) -> Report:
+    """Reconcile the tracker with the status messages of `channel` in a time range."""
+    report = Report()
+    states = await collect(channel, after, before, report)
+    logger.info('Backfill of channel %s collected %s task states from %s messages', channel.id, len(states), report.messages)
+    if not states:
+        return report
+    # Live updates of the same tasks wait until the backfill has written, and
+    # entries already queued for them stay in the outbox until then.
+    async with locks.tracker_locks.acquire(*states), outbox.hold(states):
+        # No call timeout: the locks and the hold must outlive the worker, or a
+        # late bulk write could land on top of queued live entries.
+        cells = await async_sheets.run(plan, states, report, timeout=None, priority=sheets_scheduler.BACKGROUND)
+        if dry_run or not cells:
+            return report
+        report.requests = await async_sheets.run(spreadsheet.write_sheet_cells, cells, timeout=None, priority=sheets_scheduler.BACKGROUND)
+    for sheet_title, sheet_cells in cells.items():
+        await asyncio.to_thread(mirror.apply_cells, sheet_title, sheet_cells)
+    logger.info('Backfill of channel %s wrote %s task updates in %s requests', channel.id, len(report.writes), report.requests)
+    return report
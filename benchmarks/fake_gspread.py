@@ -0,0 +1,239 @@
+"""
+In-memory stand-in for the parts of gspread used by spreadsheet.py.
+
+Each request sleeps for a configurable latency, may fail with a 429 quota
+error at a configurable rate, and is counted per method so a benchmark can
+report how many API calls an update costs.
+"""
+import random
+import threading
+import time
+from collections import Counter
+
+import gspread
+from gspread import utils
+
+
+class FakeResponse:
+    def __init__(self, code: int, message: str):
+        self.status_code = code
+        self.text = message
+        self._error = {"code": code, "message": message, "status": "RESOURCE_EXHAUSTED" if code == 429 else "ERROR"}
+
+    def json(self):
+        return {"error": self._error}
+
+
+class FakeBackend:
+    """Shared latency, error injection and call counters for one fake spreadsheet."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, quota_error_rate: float = 0.0, seed: int | None = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.quota_error_rate = quota_error_rate
+        self.calls = Counter()
+        self.errors = Counter()
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+
+    def request(self, method: str):
+        with self._lock:
+            self.calls[method] += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            fail = self._random.random() < self.quota_error_rate
+            if fail:
+                self.errors[method] += 1
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise gspread.exceptions.APIError(FakeResponse(429, "Quota exceeded for quota metric 'Read requests'"))
+
+    def total_calls(self) -> int:
+        with self._lock:
+            return sum(self.calls.values())
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+            self.errors.clear()
+
+
+def _bounds(range_name: str, row_count: int, col_count: int) -> tuple[int, int, int, int]:
+    grid = utils.a1_range_to_grid_range(range_name)
+    return (
+        grid.get("startRowIndex", 0),
+        grid.get("endRowIndex", row_count),
+        grid.get("startColumnIndex", 0),
+        grid.get("endColumnIndex", col_count),
+    )
+
+
+def _trim(rows: list[list[str]]) -> list[list[str]]:
+    trimmed = []
+    for row in rows:
+        row = list(row)
+        while row and row[-1] == "":
+            row.pop()
+        trimmed.append(row)
+    while trimmed and not trimmed[-1]:
+        trimmed.pop()
+    return trimmed
+
+
+class FakeWorksheet:
+    def __init__(self, backend: FakeBackend, title: str, sheet_id: int, rows: list[list[str]], col_count: int | None = None):
+        self.backend = backend
+        self.title = title
+        self.id = sheet_id
+        width = max((len(row) for row in rows), default=0)
+        self.col_count = col_count or max(width, 26)
+        self.row_count = max(len(rows), 1000)
+        self._cells = [list(row) + [""] * (self.col_count - len(row)) for row in rows]
+        self._lock = threading.Lock()
+
+    def _value(self, row: int, col: int) -> str:
+        if row > len(self._cells) or col > self.col_count:
+            return ""
+        return self._cells[row - 1][col - 1]
+
+    def _set(self, row: int, col: int, value):
+        if col > self.col_count:
+            raise gspread.exceptions.APIError(FakeResponse(400, f"Range exceeds grid limits: column {col}"))
+        while len(self._cells) < row:
+            self._cells.append([""] * self.col_count)
+        self._cells[row - 1][col - 1] = "" if value is None else str(value)
+
+    def _read(self, range_name: str) -> list[list[str]]:
+        start_row, end_row, start_col, end_col = _bounds(range_name, self.row_count, self.col_count)
+        with self._lock:
+            rows = [
+                [self._value(row, col) for col in range(start_col + 1, end_col + 1)]
+                for row in range(start_row + 1, min(end_row, len(self._cells)) + 1)
+            ]
+        return _trim(rows)
+
+    def get(self, range_name: str | None = None, **kwargs):
+        self.backend.request("get")
+        return self._read(range_name or f"A1:{utils.rowcol_to_a1(self.row_count, self.col_count)}")
+
+    def batch_get(self, ranges, **kwargs):
+        self.backend.request("batch_get")
+        return [self._read(range_name) for range_name in ranges]
+
+    def get_all_values(self, **kwargs):
+        self.backend.request("get_all_values")
+        with self._lock:
+            return _trim(self._cells)
+
+    def row_values(self, row: int, **kwargs):
+        self.backend.request("row_values")
+        with self._lock:
+            values = [self._value(row, col) for col in range(1, self.col_count + 1)]
+        trimmed = _trim([values])
+        return trimmed[0] if trimmed else []
+
+    def col_values(self, col: int, **kwargs):
+        self.backend.request("col_values")
+        with self._lock:
+            values = [[self._value(row, col)] for row in range(1, len(self._cells) + 1)]
+        return [row[0] if row else "" for row in _trim(values)]
+
+    def cell(self, row: int, col: int, **kwargs):
+        self.backend.request("cell")
+        with self._lock:
+            return gspread.cell.Cell(row, col, self._value(row, col) or None)
+
+    def update_cell(self, row: int, col: int, value):
+        self.backend.request("update_cell")
+        with self._lock:
+            self._set(row, col, value)
+
+    def batch_update(self, data, **kwargs):
+        self.backend.request("batch_update")
+        with self._lock:
+            for item in data:
+                start_row, _, start_col, _ = _bounds(item["range"], self.row_count, self.col_count)
+                for r, values in enumerate(item["values"]):
+                    for c, value in enumerate(values):
+                        self._set(start_row + r + 1, start_col + c + 1, value)
+        return {"totalUpdatedCells": sum(len(values) for item in data for values in item["values"])}
+
+
+class FakeSpreadsheet:
+    def __init__(self, backend: FakeBackend, spreadsheet_id: str = "fake"):
+        self.backend = backend
+        self.id = spreadsheet_id
+        self._worksheets: list[FakeWorksheet] = []
+
+    def add_worksheet(self, title: str, rows: list[list[str]], col_count: int | None = None) -> FakeWorksheet:
+        ws = FakeWorksheet(self.backend, title, len(self._worksheets), rows, col_count)
+        self._worksheets.append(ws)
+        return ws
+
+    def worksheets(self, **kwargs):
+        self.backend.request("worksheets")
+        return list(self._worksheets)
+
+    def values_batch_get(self, ranges, params=None):
+        self.backend.request("values_batch_get")
+        value_ranges = []
+        for range_name in ranges:
+            sheet_name, _, cells = range_name.partition("!")
+            title = sheet_name[1:-1].replace("''", "'") if sheet_name.startswith("'") else sheet_name
+            ws = next(ws for ws in self._worksheets if ws.title == title)
+            values = ws._read(cells) if cells else ws._read(f"A1:{utils.rowcol_to_a1(ws.row_count, ws.col_count)}")
+            value_ranges.append({"range": range_name, "majorDimension": "ROWS", "values": values})
+        return {"spreadsheetId": self.id, "valueRanges": value_ranges}
+
+    def values_batch_update(self, body=None):
+        self.backend.request("values_batch_update")
+        updated = 0
+        for item in body["data"]:
+            sheet_name, _, cells = item["range"].partition("!")
+            title = sheet_name[1:-1].replace("''", "'") if sheet_name.startswith("'") else sheet_name
+            ws = next(ws for ws in self._worksheets if ws.title == title)
+            with ws._lock:
+                start_row, _, start_col, _ = _bounds(cells, ws.row_count, ws.col_count)
+                for r, values in enumerate(item["values"]):
+                    for c, value in enumerate(values):
+                        ws._set(start_row + r + 1, start_col + c + 1, value)
+                        updated += 1
+        return {"spreadsheetId": self.id, "totalUpdatedCells": updated}
+
+    def worksheet(self, title: str):
+        self.backend.request("worksheet")
+        for ws in self._worksheets:
+            if ws.title == title:
+                return ws
+        raise gspread.WorksheetNotFound(title)
+
+
+class FakeClient:
+    def __init__(self, spreadsheet: FakeSpreadsheet):
+        self.spreadsheet = spreadsheet
+
+    def set_timeout(self, timeout):
+        pass
+
+    def open_by_key(self, key: str) -> FakeSpreadsheet:
+        self.spreadsheet.backend.request("open_by_key")
+        return self.spreadsheet
+
+
+TASKS = (("TL", 1), ("TS", 2), ("PR", 1), ("QC", 1))
+
+
+def tracker_rows(chapters: int, tasks=TASKS) -> list[list[str]]:
+    """
+    Rows of a tracker worksheet: a title row, task headers in row 2, Name/Status
+    sub-headers in row 3 and one row per chapter. Each task is given as
+    (label, number of name slots).
+    """
+    header = ["Chapter"]
+    sub_headers = [""]
+    for label, slots in tasks:
+        header += [label] + [""] * slots
+        sub_headers += ["Name"] + [""] * (slots - 1) + ["Status"]
+    rows = [["Tracker"], header, sub_headers]
+    rows += [[str(chapter)] for chapter in range(1, chapters + 1)]
+    return rows
@@ -0,0 +1,177 @@
+"""
+Offline benchmark of the tracker hot path.
+
+Synthetic status messages are fed through event_listener.on_message at a
+configurable rate against an in-memory fake of the tracker spreadsheet, and
+the run reports throughput, p50/p99 latency and Sheets API calls per update.
+No network access or Discord connection is needed.
+
+    python benchmarks/run_benchmark.py --messages 200 --rate 20 --latency 0.15
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import gspread
+
+import fake_gspread
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.sent: list[str] = []
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append(content)
+
+
+class FakeAuthor:
+    def __init__(self, user_id: int, name: str):
+        self.id = user_id
+        self.name = name
+        self.bot = False
+
+
+class FakeMessage:
+    _ids = itertools.count(1)
+
+    def __init__(self, content: str, author: FakeAuthor, channel: FakeChannel):
+        self.id = next(self._ids)
+        self.content = content
+        self.author = author
+        self.channel = channel
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200, help="status messages to send")
+    parser.add_argument("--rate", type=float, default=20.0, help="messages per second (0 sends all at once)")
+    parser.add_argument("--updates-per-message", type=int, default=1, help="status lines per message")
+    parser.add_argument("--chatter-ratio", type=float, default=0.0, help="non-status messages sent per status message")
+    parser.add_argument("--series", type=int, default=5, help="worksheets in the fake spreadsheet")
+    parser.add_argument("--chapters", type=int, default=300, help="chapter rows per worksheet")
+    parser.add_argument("--latency", type=float, default=0.15, help="seconds per fake Sheets request")
+    parser.add_argument("--jitter", type=float, default=0.05, help="extra random seconds per request")
+    parser.add_argument("--quota-error-rate", type=float, default=0.0, help="fraction of requests failing with 429")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def build_messages(args, titles: list[str], authors: list[FakeAuthor], channel: FakeChannel) -> list[tuple[FakeMessage, int]]:
+    """Status messages touching distinct (series, chapter, task) cells, so no collision prompts fire."""
+    cells = itertools.product(range(1, args.chapters + 1), [task for task, _ in fake_gspread.TASKS], titles)
+    messages = []
+    for i in range(args.messages):
+        lines = []
+        for _ in range(args.updates_per_message):
+            chapter, task, title = next(cells)
+            lines.append(f"{title} ch {chapter} {task} Done")
+        messages.append((FakeMessage("\n".join(lines), authors[i % len(authors)], channel), len(lines)))
+        for _ in range(int(args.chatter_ratio)):
+            messages.append((FakeMessage("lol nice, thanks for the chapter", authors[i % len(authors)], channel), 0))
+    return messages
+
+
+async def run(args):
+    backend = fake_gspread.FakeBackend(args.latency, args.jitter, args.quota_error_rate, args.seed)
+    spreadsheet = fake_gspread.FakeSpreadsheet(backend)
+    titles = [f"Series {i + 1}" for i in range(args.series)]
+    for title in titles:
+        spreadsheet.add_worksheet(title, fake_gspread.tracker_rows(args.chapters))
+    gspread.service_account = lambda *a, **kw: fake_gspread.FakeClient(spreadsheet)
+
+    import database
+    import event_listener
+    import metrics
+    import sheets_scheduler
+    import startup
+
+    authors = [FakeAuthor(1000 + i, f"staff{i}") for i in range(5)]
+    for title in titles:
+        database.add_series(title, title)
+    for author in authors:
+        database.add_user(author.name, author.name.title())
+
+    # Stand-in for on_ready: connect and warm the caches before the load starts.
+    warm_started = time.perf_counter()
+    await startup.warm_up()
+    warm_up = time.perf_counter() - warm_started
+    warm_up_calls = backend.total_calls()
+
+    channel = FakeChannel(1)
+    messages = build_messages(args, titles, authors, channel)
+    backend.reset()
+
+    latencies: list[float] = []
+
+    async def deliver(message: FakeMessage, updates: int):
+        started = time.perf_counter()
+        await event_listener.on_message(message)
+        if updates:
+            latencies.append(time.perf_counter() - started)
+
+    interval = 1 / args.rate if args.rate > 0 else 0
+    started = time.perf_counter()
+    tasks = []
+    for i, (message, updates) in enumerate(messages):
+        delay = started + i * interval - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(deliver(message, updates)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    updates = sum(count for _, count in messages)
+    confirmed = sum(line.count("Updated:") for line in channel.sent if line)
+    calls = backend.total_calls()
+    print(f"warm-up:           {warm_up:.2f}s ({warm_up_calls} api calls)")
+    print(f"messages:          {len(messages)} ({updates} updates, {confirmed} confirmed)")
+    print(f"elapsed:           {elapsed:.2f}s")
+    print(f"throughput:        {updates / elapsed:.1f} updates/s")
+    print(f"latency p50:       {percentile(latencies, 50) * 1000:.0f} ms")
+    print(f"latency p99:       {percentile(latencies, 99) * 1000:.0f} ms")
+    if latencies:
+        print(f"latency mean:      {statistics.mean(latencies) * 1000:.0f} ms")
+    print(f"api calls:         {calls} ({calls / max(updates, 1):.2f} per update)")
+    for method, count in sorted(backend.calls.items()):
+        print(f"  {method:<16} {count}")
+    if backend.errors:
+        print(f"injected 429s:     {sum(backend.errors.values())}")
+    for name, rates in sorted(metrics.snapshot()["cache"].items()):
+        print(f"cache {name:<19} {rates['hit_rate']:.0%} of {rates['hits'] + rates['misses']}")
+    print(f"scheduler:         {sheets_scheduler.stats()}")
+
+
+def main():
+    args = parse_args()
+    # Keep the token buckets out of the way unless quota behaviour is being measured.
+    os.environ.setdefault("SHEETS_READS_PER_MINUTE", "100000")
+    os.environ.setdefault("SHEETS_WRITES_PER_MINUTE", "100000")
+    os.environ.setdefault("SHEETS_BURST", "1000")
+    os.environ.setdefault("SHEETS_BACKOFF_BASE", "0.1")
+    # database.py keeps toru.db in the working directory.
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
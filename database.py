@@ -1,39 +1,169 @@
-import sqlite3
+"""
+USERS and SERIES storage, and the OUTBOX table of pending tracker writes.
+
+Both tables are small and read on every message, so they are kept in memory:
+lookups are dictionary hits, and writes update the cache immediately and are
+persisted by a dedicated writer thread that batches commits on a WAL-mode
+SQLite connection. Nothing is opened at import time: init() runs on first use,
+or earlier from the startup warm-up.
+"""
+import atexit
 import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
 
 logger = logging.getLogger(__name__)
 
-conn = sqlite3.connect('toru.db')
-cursor = conn.cursor()
-logger.info('Database connection established')
+DB_PATH = 'toru.db'
+# The writer commits once this many writes are pending, or COMMIT_INTERVAL
+# seconds after the first of them arrived.
+COMMIT_BATCH = 100
+COMMIT_INTERVAL = 0.05
+
+
+def connect() -> sqlite3.Connection:
+    """Open a WAL-mode connection to the bot database."""
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class _Writer(threading.Thread):
+    """Applies queued writes on its own connection, committing them in batches."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        super().__init__(name="database-writer", daemon=True)
+        self.conn = conn
+        self.queue: queue.Queue = queue.Queue()
+
+    def submit(self, sql: str, params: tuple) -> Future:
+        future = Future()
+        self.queue.put((sql, params, future))
+        return future
+
+    def stop(self):
+        self.queue.put(None)
+        self.join()
+
+    def run(self):
+        running = True
+        while running:
+            item = self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + COMMIT_INTERVAL
+            while len(batch) < COMMIT_BATCH:
+                try:
+                    item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                batch.append(item)
+            self._commit(batch)
+        self.conn.close()
 
-cursor.execute("CREATE TABLE IF NOT EXISTS USERS (name TEXT PRIMARY KEY, scannname TEXT)")
-cursor.execute("CREATE TABLE IF NOT EXISTS SERIES (sheet_name TEXT, name TEXT PRIMARY KEY)")
+    def _commit(self, batch: list):
+        # Writes whose caller stopped waiting are still applied; only their futures are dropped.
+        futures = [future for _, _, future in batch if future.set_running_or_notify_cancel()]
+        try:
+            for sql, params, _ in batch:
+                self.conn.execute(sql, params)
+            self.conn.commit()
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error('Failed to commit %s database writes: %s', len(batch), e)
+            for future in futures:
+                future.set_exception(e)
+            return
+        logger.debug('Committed %s database writes', len(batch))
+        for future in futures:
+            future.set_result(None)
 
-def add_user(name: str, scannname: str):
-    cursor.execute("INSERT OR REPLACE INTO USERS (name, scannname) VALUES (?, ?)", (name, scannname))
-    conn.commit()
-    logger.info(f'Added/Updated user: {name} -> {scannname}')
+
+_init_lock = threading.Lock()
+_users: dict[str, str] = {}
+_series: dict[str, str] = {}
+_writer: _Writer | None = None
+
+
+def init():
+    """Open the database, create the tables and load the caches. Safe to call repeatedly."""
+    global _writer
+    if _writer is not None:
+        return
+    with _init_lock:
+        if _writer is not None:
+            return
+        conn = connect()
+        conn.execute("CREATE TABLE IF NOT EXISTS USERS (name TEXT PRIMARY KEY, scannname TEXT)")
+        conn.execute("CREATE TABLE IF NOT EXISTS SERIES (sheet_name TEXT, name TEXT PRIMARY KEY)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS OUTBOX ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, token TEXT UNIQUE, sheet_title TEXT, chapter TEXT, task TEXT, "
+            "user_name TEXT, status TEXT, replace INTEGER, replace_col INTEGER, channel_id INTEGER, "
+            "created_at REAL, attempts INTEGER DEFAULT 0, next_attempt REAL, cell_key TEXT)"
+        )
+        if "cell_key" not in {row[1] for row in conn.execute("PRAGMA table_info(OUTBOX)")}:
+            # Outbox tables created before entries were keyed by cell.
+            conn.execute("ALTER TABLE OUTBOX ADD COLUMN cell_key TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS OUTBOX_CELL ON OUTBOX (cell_key, id)")
+        conn.commit()
+        logger.info('Database connection established')
+
+        _users.update(conn.execute("SELECT name, scannname FROM USERS").fetchall())
+        _series.update({name: sheet_name for sheet_name, name in conn.execute("SELECT sheet_name, name FROM SERIES").fetchall()})
+        logger.info('Loaded %s users and %s series aliases', len(_users), len(_series))
+
+        writer = _Writer(conn)
+        writer.start()
+        atexit.register(writer.stop)
+        _writer = writer
+
+
+def submit(sql: str, params: tuple) -> Future:
+    """Queue a write for the writer thread; the Future resolves once it is committed."""
+    init()
+    return _writer.submit(sql, params)
+
+
+def add_user(name: str, scannname: str) -> Future:
+    init()
+    _users[name] = scannname
+    future = _writer.submit("INSERT OR REPLACE INTO USERS (name, scannname) VALUES (?, ?)", (name, scannname))
+    logger.info('Added/Updated user: %s -> %s', name, scannname)
+    return future
 
 def get_user_scannname(name: str) -> str|None:
-    cursor.execute("SELECT scannname FROM USERS WHERE name = ?", (name,))
-    result = cursor.fetchone()
-    scannname = result[0] if result else None
-    logger.debug(f'Retrieved scannname for {name}: {scannname}')
+    init()
+    scannname = _users.get(name)
+    logger.debug('Retrieved scannname for %s: %s', name, scannname)
     return scannname
 
-def add_series(sheet_name: str, name: str):
+def add_series(sheet_name: str, name: str) -> Future:
     """Map an alias `name` to a worksheet title `sheet_name`."""
+    init()
     normalized_name = name.strip().title()
-    cursor.execute("INSERT OR REPLACE INTO SERIES (sheet_name, name) VALUES (?, ?)", (sheet_name, normalized_name))
-    conn.commit()
-    logger.info(f'Added/Updated series alias: {normalized_name} -> {sheet_name}')
+    _series[normalized_name] = sheet_name
+    future = _writer.submit("INSERT OR REPLACE INTO SERIES (sheet_name, name) VALUES (?, ?)", (sheet_name, normalized_name))
+    logger.info('Added/Updated series alias: %s -> %s', normalized_name, sheet_name)
+    return future
 
 def get_series_by_name(name: str) -> str|None:
     """Return the worksheet title for the given alias `name`, or None."""
+    init()
     normalized_name = name.strip().title()
-    cursor.execute("SELECT sheet_name FROM SERIES WHERE name = ?", (normalized_name,))
-    result = cursor.fetchone()
-    sheet_name = result[0] if result else None
-    logger.debug(f'Retrieved sheet_name for {normalized_name}: {sheet_name}')
-    return sheet_name
\ No newline at end of file
+    sheet_name = _series.get(normalized_name)
+    logger.debug('Retrieved sheet_name for %s: %s', normalized_name, sheet_name)
+    return sheet_name
+
+def get_all_series() -> list[tuple[str, str]]:
+    """Return every saved (sheet_name, alias) pair."""
+    init()
+    return [(sheet_name, name) for name, sheet_name in _series.items()]
@@ -1,7 +1,10 @@
 from bot_instance import bot
-import re
 import logging
-from util import update_tracker
+import metrics
+import prompts
+import startup
+import status_parser
+from util import update_tracker_batch
 
 logger = logging.getLogger(__name__)
 
@@ -11,31 +14,27 @@ async def on_message(message):
     # if message.channel.id == 1005760529400352788:
         if message.author.bot:
             return
+        # Replies to a pending question never count as status updates.
+        if prompts.dispatcher.dispatch(message):
+            return
 
-        logger.info(
-            f"Processing message from channel {message.channel.id}: {message.content}"
-        )
-        status_pattern = re.compile(
-            r"(?i)^(.+?)\s+ch\s*(\d+(?:\.\d+)?)\s+([A-Za-z]+)\s+(Done|Working|Help)$"
-        )
-        cleaned = ' '.join(message.content.split())
-        match = status_pattern.match(cleaned)
-        if match:
-            name = match.group(1)
-            chapter_number = match.group(2)
-            task = match.group(3)
-            status = match.group(4).capitalize()
+        rejected = []
+        with metrics.timer("parse"):
+            updates = status_parser.parse(message.content, rejected)
+        if rejected:
+            logger.info("Rejected chapter ranges in message %s: %s", message.id, rejected)
+            await message.channel.send(
+                f"Chapter ranges must count up and cover at most {status_parser.MAX_RANGE} whole chapters, so I skipped:\n"
+                + "\n".join(rejected)
+            )
+        if not updates:
+            return
 
-            response = {
-                "Name": name,
-                "Chapter Number": chapter_number,
-                "Task": task,
-                "Status": status,
-            }
-            logger.info(f"Matched status update: {response}")
-            await update_tracker(response, message)
-        else:
-            logger.debug(f"Message did not match pattern: {message.content}")
+        logger.info("Matched %s status updates in channel %s: %s", len(updates), message.channel.id, updates)
+        if not startup.ready.is_set():
+            logger.info("Queued message %s until startup warm-up finishes", message.id)
+            await startup.wait_ready()
+        await update_tracker_batch(updates, message)
 
 
 logger.info("Event listener for on_message has been set up")
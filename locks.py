@@ -0,0 +1,69 @@
+"""
+Keyed asyncio locks.
+
+Tracker updates lock only the (sheet, chapter, task) cells they touch, so
+updates to different rows or worksheets run concurrently while updates to
+the same task are serialized from the empty-slot check to the write.
+"""
+import asyncio
+import contextlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class KeyedLock:
+    """asyncio.Lock per key, created on first use and dropped once nobody holds or waits on it."""
+
+    def __init__(self):
+        # key -> [lock, number of holders and waiters]
+        self._locks: dict = {}
+
+    def _register(self, key) -> asyncio.Lock:
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        return entry[0]
+
+    def _unregister(self, key):
+        entry = self._locks[key]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._locks[key]
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, *keys):
+        """
+        Hold the locks of all `keys` for the duration of the block. Keys are
+        taken in sorted order so overlapping multi-key holders cannot deadlock.
+        """
+        ordered = sorted(set(keys))
+        held = []
+        try:
+            for key in ordered:
+                lock = self._register(key)
+                try:
+                    if lock.locked():
+                        logger.debug('Waiting for lock %s', key)
+                    await lock.acquire()
+                except BaseException:
+                    self._unregister(key)
+                    raise
+                held.append(key)
+            yield
+        finally:
+            for key in reversed(held):
+                self._locks[key][0].release()
+                self._unregister(key)
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+tracker_locks = KeyedLock()
+
+
+def task_key(sheet_title: str, chapter_key: str, task: str) -> tuple[str, str, str]:
+    """Lock key of one task cell group; `chapter_key` is the normalized chapter number."""
+    return (sheet_title, chapter_key, str(task).strip().lower())
@@ -0,0 +1,57 @@
+"""
+Logging setup.
+
+Records are put on a queue by the thread that logs them and written to the
+console and a size-rotated log file by a background listener thread, so
+disk I/O never happens on the event loop. Levels can be set per module.
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+
+LOG_FILE = 'toru_bot.log'
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+def _module_levels(spec: str) -> dict[str, str]:
+    """Parse "spreadsheet=DEBUG,discord=WARNING" into {logger name: level}."""
+    levels = {}
+    for item in spec.split(','):
+        name, sep, level = item.partition('=')
+        if sep and name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging():
+    """
+    Configure the root logger from the environment:
+    LOG_LEVEL (default INFO), LOG_LEVELS for per-module overrides,
+    LOG_MAX_BYTES and LOG_BACKUP_COUNT for file rotation.
+    """
+    formatter = logging.Formatter(LOG_FORMAT)
+    file_handler = logging.handlers.RotatingFileHandler(
+        LOG_FILE,
+        maxBytes=int(os.getenv('LOG_MAX_BYTES', str(5 * 1024 * 1024))),
+        backupCount=int(os.getenv('LOG_BACKUP_COUNT', '5')),
+        encoding='utf-8',
+    )
+    file_handler.setFormatter(formatter)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    for name, level in _module_levels(os.getenv('LOG_LEVELS', '')).items():
+        logging.getLogger(name).setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
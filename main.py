@@ -1,33 +1,235 @@
 import os 
+import io
 import logging
+import discord
 from dotenv import load_dotenv
-from bot_instance import bot
+from log_config import setup_logging
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('toru_bot.log'),
-        logging.StreamHandler()
-    ]
-)
+load_dotenv()
+setup_logging()
 logger = logging.getLogger(__name__)
 
-load_dotenv()
+from bot_instance import bot
+
 token = str(os.getenv("TOKEN"))
 
+import asyncio
+import datetime
 import event_listener
+import backfill
+import async_sheets
+import database
+import mirror
+import outbox
+import spreadsheet
+import startup
+import sheets_scheduler
+import metrics
+
+_mirror_task = None
+
+async def _sync_mirror_forever():
+    """Re-sync the local mirror every MIRROR_SYNC_INTERVAL seconds at background priority."""
+    await startup.wait_ready()
+    while True:
+        try:
+            await async_sheets.run(mirror.sync, priority=sheets_scheduler.BACKGROUND)
+        except Exception as e:
+            logger.error('Mirror sync failed: %r', e)
+        await asyncio.sleep(mirror.SYNC_INTERVAL)
 
 @bot.event
 async def on_ready():
-    logger.info(f'{bot.user} is ready and connected')
+    global _mirror_task
+    logger.info('%s is ready and connected', bot.user)
     print(f'{bot.user} is Ready.')
+    # on_ready fires again after reconnects; warm up and sync only once.
+    startup.start()
+    if _mirror_task is None:
+        _mirror_task = asyncio.create_task(_sync_mirror_forever())
+
+def _mirror_footer() -> str:
+    age = mirror.last_sync_age()
+    return "-# Mirror not synced yet." if age is None else f"-# From the local mirror, synced {age / 60:.0f} min ago."
+
+def _fit_lines(lines: list[str], footer: str, limit: int = 2000) -> str:
+    """Join `lines` and the footer, dropping trailing lines to stay within one message."""
+    shown = []
+    size = len(footer) + 40
+    for line in lines:
+        size += len(line) + 1
+        if size > limit:
+            shown.append(f"... and {len(lines) - len(shown)} more")
+            break
+        shown.append(line)
+    return '\n'.join([*shown, footer])
+
+def _describe(entry: dict) -> str:
+    names = ', '.join(entry['names']) or 'unassigned'
+    return f"{entry['task']}: {names} ({entry['status'] or 'no status'})"
 
 @bot.command(name='ping', description='Check if the bot is responsive')
 async def ping(ctx):
     """Responds with 'Pong!' to test bot responsiveness."""
     await ctx.respond('Pong!')
-    logger.info(f'Ping command invoked by {ctx.author}')
+    logger.info('Ping command invoked by %s', ctx.author)
+
+@bot.command(name='stats', description='Show hot-path timings, API calls per update and cache hit rates')
+async def stats(
+    ctx,
+    format: discord.Option(str, "Output format", choices=["summary", "prometheus"], required=False, default="summary"),
+):
+    """Reports rolling latency percentiles per stage, or dumps them in Prometheus text format."""
+    if format == "prometheus":
+        dump = discord.File(io.BytesIO(metrics.prometheus().encode()), filename="toru_metrics.prom")
+        await ctx.respond(file=dump, ephemeral=True)
+        logger.info('Stats command (prometheus) invoked by %s', ctx.author)
+        return
+    data = metrics.snapshot()
+    rows = [f"{'stage':<24}{'count':>7}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}"]
+    for stage, summary in sorted(data["histograms"].items()):
+        if stage == "outbox.api_calls_per_entry":
+            continue
+        rows.append(
+            f"{stage[:23]:<24}{summary['count']:>7}{summary['p50'] * 1000:>9.1f}"
+            f"{summary['p99'] * 1000:>9.1f}{summary['max'] * 1000:>9.1f}"
+        )
+    counters = data["counters"]
+    updates = counters.get("updates", 0)
+    requests = counters.get("sheets_read_requests", 0) + counters.get("sheets_write_requests", 0)
+    lines = ["```", *rows, "```"]
+    api_calls = data["histograms"].get("outbox.api_calls_per_entry")
+    if updates:
+        lines.append(f"Sheets requests per update: {requests / updates:.2f} overall"
+                     + (f", {api_calls['p50']:.2f} p50 / {api_calls['p99']:.2f} p99 per applied entry" if api_calls else ""))
+    if data["cache"]:
+        lines.append("Cache hit rates: " + ", ".join(
+            f"{name} {rates['hit_rate']:.0%} ({rates['hits']}/{rates['hits'] + rates['misses']})"
+            for name, rates in sorted(data["cache"].items())
+        ))
+    await ctx.respond('\n'.join(lines), ephemeral=True)
+    logger.info('Stats command invoked by %s', ctx.author)
+
+@bot.command(name='refresh_cache', description='Re-read task headers and chapter rows from the tracker sheet')
+@discord.default_permissions(administrator=True)
+async def refresh_cache(
+    ctx,
+    sheet: discord.Option(str, "Worksheet title (leave empty for all worksheets)", required=False, default=None),
+):
+    """Drops cached header layouts and chapter indexes so the next update re-reads them."""
+    spreadsheet.invalidate_caches(sheet)
+    await ctx.respond(f"Cleared cached sheet data for {sheet or 'all worksheets'}.", ephemeral=True)
+    logger.info('Refresh cache command invoked by %s for %s', ctx.author, sheet or "all worksheets")
+
+@bot.command(name='quota', description='Show Google Sheets request queue depth and throttling')
+@discord.default_permissions(administrator=True)
+async def quota(ctx):
+    """Reports the Sheets scheduler's queues, remaining tokens and throttle counters."""
+    stats = sheets_scheduler.stats()
+    lines = []
+    for kind in (sheets_scheduler.READ, sheets_scheduler.WRITE):
+        queued = ', '.join(f"{lane}={depth}" for lane, depth in stats['queued'][kind].items())
+        lines.append(
+            f"**{kind}**: queued {queued}; tokens {stats['tokens'][kind]}; "
+            f"requests {stats['requests'][kind]}; throttled {stats['throttled'][kind]}; "
+            f"5xx {stats['server_errors'][kind]}; retries {stats['retries'][kind]}; "
+            f"failed {stats['failures'][kind]}; waited {stats['wait_seconds'][kind]:.1f}s"
+        )
+    pending = await asyncio.to_thread(outbox.pending_count)
+    lines.append(f"**outbox**: {pending} updates waiting to be written")
+    await ctx.respond('\n'.join(lines), ephemeral=True)
+    logger.info('Quota command invoked by %s', ctx.author)
+
+@bot.command(name='chapter', description='Show who is on each task of a chapter')
+async def chapter(
+    ctx,
+    series: discord.Option(str, "Series name or alias"),
+    number: discord.Option(str, "Chapter number"),
+):
+    """Lists every task of one chapter from the local mirror."""
+    sheet_title = await asyncio.to_thread(mirror.resolve_series, series)
+    if sheet_title is None:
+        await ctx.respond(f'Unknown series "{series}".', ephemeral=True)
+        return
+    entries = await asyncio.to_thread(mirror.chapter_status, sheet_title, number)
+    if not entries:
+        await ctx.respond(f'Chapter {number} of "{sheet_title}" is not on the tracker.\n{_mirror_footer()}', ephemeral=True)
+        return
+    lines = [f"**{sheet_title}** chapter {entries[0]['chapter']}", *(_describe(entry) for entry in entries)]
+    await ctx.respond(_fit_lines(lines, _mirror_footer()), ephemeral=True)
+    logger.info('Chapter command invoked by %s for %s ch %s', ctx.author, sheet_title, number)
+
+@bot.command(name='open_tasks', description='List unfinished tasks of a series')
+async def open_tasks(
+    ctx,
+    series: discord.Option(str, "Series name or alias"),
+):
+    """Lists tasks whose status is not Done, by chapter, from the local mirror."""
+    sheet_title = await asyncio.to_thread(mirror.resolve_series, series)
+    if sheet_title is None:
+        await ctx.respond(f'Unknown series "{series}".', ephemeral=True)
+        return
+    entries = await asyncio.to_thread(mirror.open_tasks, sheet_title)
+    lines = [f"**{sheet_title}**: {len(entries)} open tasks"]
+    lines += [f"Ch {entry['chapter']} {_describe(entry)}" for entry in entries]
+    await ctx.respond(_fit_lines(lines, _mirror_footer()), ephemeral=True)
+    logger.info('Open tasks command invoked by %s for %s', ctx.author, sheet_title)
+
+@bot.command(name='assignments', description='List the tasks assigned to a staff member')
+async def assignments(
+    ctx,
+    user: discord.Option(str, "Name as written on the tracker (defaults to yours)", required=False, default=None),
+):
+    """Lists tasks naming a user across all series, unfinished ones first, from the local mirror."""
+    user_name = user or await asyncio.to_thread(database.get_user_scannname, ctx.author.name)
+    if not user_name:
+        await ctx.respond("I don't know your name on the tracker yet; pass it as `user`.", ephemeral=True)
+        return
+    found = await asyncio.to_thread(mirror.user_assignments, user_name)
+    lines = [f"**{user_name}**: {len(found)} tasks"]
+    lines += [f"{sheet_title} ch {entry['chapter']} {_describe(entry)}" for sheet_title, entry in found]
+    await ctx.respond(_fit_lines(lines, _mirror_footer()), ephemeral=True)
+    logger.info('Assignments command invoked by %s for %s', ctx.author, user_name)
+
+def _parse_time(value: str) -> datetime.datetime:
+    """ISO date or date-time; naive values are taken as UTC."""
+    parsed = datetime.datetime.fromisoformat(value.strip())
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=datetime.timezone.utc)
+
+@bot.command(name='backfill', description='Re-apply status messages from channel history to the tracker')
+@discord.default_permissions(administrator=True)
+async def backfill_command(
+    ctx,
+    since: discord.Option(str, "Start of the range, e.g. 2024-05-01 or 2024-05-01T18:00 (UTC)"),
+    until: discord.Option(str, "End of the range (defaults to now)", required=False, default=None),
+    channel: discord.Option(discord.TextChannel, "Channel to read (defaults to this one)", required=False, default=None),
+    apply: discord.Option(bool, "Write the changes; otherwise only report them", required=False, default=False),
+):
+    """Collapses status messages in a time range to the latest state per task and writes the differences in bulk."""
+    try:
+        after = _parse_time(since)
+        before = _parse_time(until) if until else None
+    except ValueError:
+        await ctx.respond("Times must be ISO dates like `2024-05-01` or `2024-05-01T18:00`.", ephemeral=True)
+        return
+    channel = channel or ctx.channel
+    await ctx.defer(ephemeral=True)
+    logger.info('Backfill command invoked by %s for channel %s from %s to %s (apply=%s)', ctx.author, channel.id, after, before, apply)
+    try:
+        report = await backfill.backfill(channel, after, before, dry_run=not apply)
+    except Exception as e:
+        logger.error('Backfill of channel %s failed: %r', channel.id, e)
+        await ctx.followup.send(f"Backfill failed: {e}", ephemeral=True)
+        return
+    lines = report.lines(dry_run=not apply)
+    if not apply and report.writes:
+        lines.append("Run again with `apply: True` to write these changes.")
+    text = '\n'.join(lines)
+    if len(text) > 2000:
+        dump = discord.File(io.BytesIO(text.encode()), filename="backfill_report.txt")
+        await ctx.followup.send(lines[0] + '\n' + lines[1], file=dump, ephemeral=True)
+    else:
+        await ctx.followup.send(text, ephemeral=True)
 
 logger.info('Starting bot...')
 bot.run(token)
\ No newline at end of file
@@ -0,0 +1,152 @@
+"""
+Hot-path instrumentation.
+
+Stage timings go into rolling histograms (the last WINDOW samples per
+stage), alongside plain counters, cache hit/miss counts and the number of
+Sheets API calls made per tracker entry the outbox applies. Everything here
+is thread-safe, since Sheets calls are timed on the executor threads.
+"""
+import contextlib
+import contextvars
+import threading
+import time
+from collections import Counter, deque
+
+WINDOW = 1000
+
+_lock = threading.Lock()
+_samples: dict[str, deque] = {}
+_totals: dict[str, list[float]] = {}  # stage -> [count, sum] since startup
+_counters: Counter = Counter()
+_cache: dict[str, list[int]] = {}  # cache -> [hits, misses]
+
+
+class CallTrace:
+    """Sheets calls made while it is active are counted on it."""
+
+    def __init__(self):
+        self.api_calls = 0
+
+
+_trace: contextvars.ContextVar[CallTrace | None] = contextvars.ContextVar("call_trace", default=None)
+
+
+def observe(stage: str, value: float):
+    with _lock:
+        samples = _samples.get(stage)
+        if samples is None:
+            samples = _samples[stage] = deque(maxlen=WINDOW)
+            _totals[stage] = [0, 0.0]
+        samples.append(value)
+        totals = _totals[stage]
+        totals[0] += 1
+        totals[1] += value
+
+
+@contextlib.contextmanager
+def timer(stage: str):
+    """Record the wall-clock seconds spent in the block under `stage`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+
+def increment(name: str, amount: int = 1):
+    with _lock:
+        _counters[name] += amount
+
+
+def cache_lookup(cache: str, hit: bool):
+    with _lock:
+        counts = _cache.setdefault(cache, [0, 0])
+        counts[0 if hit else 1] += 1
+
+
+def count_api_call(kind: str):
+    trace = _trace.get()
+    with _lock:
+        _counters[f"sheets_{kind}_requests"] += 1
+        if trace is not None:
+            trace.api_calls += 1
+
+
+@contextlib.contextmanager
+def count_calls(stage: str, units: int = 1):
+    """
+    Record the Sheets API calls made in the block's context under `stage`,
+    divided over `units` (e.g. the entries one outbox pass applied).
+    """
+    trace = CallTrace()
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+        observe(stage, trace.api_calls / max(units, 1))
+
+
+@contextlib.contextmanager
+def trace_update(updates: int = 1):
+    """Track one tracker update (or batch of `updates` from one message): its total time is recorded when it ends."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe("update.total", time.perf_counter() - started)
+        increment("updates", updates)
+
+
+def _quantile(ordered: list[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def snapshot() -> dict:
+    """Copy of every histogram summary, counter and cache hit rate."""
+    with _lock:
+        samples = {stage: sorted(values) for stage, values in _samples.items()}
+        totals = {stage: list(values) for stage, values in _totals.items()}
+        counters = dict(_counters)
+        cache = {name: list(counts) for name, counts in _cache.items()}
+    histograms = {
+        stage: {
+            "count": int(totals[stage][0]),
+            "sum": totals[stage][1],
+            "p50": _quantile(ordered, 0.5),
+            "p90": _quantile(ordered, 0.9),
+            "p99": _quantile(ordered, 0.99),
+            "max": ordered[-1] if ordered else 0.0,
+        }
+        for stage, ordered in samples.items()
+    }
+    cache_rates = {
+        name: {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses) if hits + misses else 0.0}
+        for name, (hits, misses) in cache.items()
+    }
+    return {"histograms": histograms, "counters": counters, "cache": cache_rates}
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def prometheus() -> str:
+    """Render the snapshot in the Prometheus text exposition format."""
+    data = snapshot()
+    lines = ["# TYPE toru_stage summary"]
+    for stage, summary in sorted(data["histograms"].items()):
+        for q, quantile in (("p50", "0.5"), ("p90", "0.9"), ("p99", "0.99")):
+            lines.append(f'toru_stage{{stage="{_label(stage)}",quantile="{quantile}"}} {summary[q]}')
+        lines.append(f'toru_stage_sum{{stage="{_label(stage)}"}} {summary["sum"]}')
+        lines.append(f'toru_stage_count{{stage="{_label(stage)}"}} {summary["count"]}')
+    lines.append("# TYPE toru_events_total counter")
+    for name, value in sorted(data["counters"].items()):
+        lines.append(f'toru_events_total{{event="{_label(name)}"}} {value}')
+    lines.append("# TYPE toru_cache_lookups_total counter")
+    for name, rates in sorted(data["cache"].items()):
+        lines.append(f'toru_cache_lookups_total{{cache="{_label(name)}",result="hit"}} {rates["hits"]}')
+        lines.append(f'toru_cache_lookups_total{{cache="{_label(name)}",result="miss"}} {rates["misses"]}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,227 @@
+"""
+Local SQLite mirror of the tracker spreadsheet.
+
+Every series worksheet is flattened into one MIRROR row per (chapter, task)
+holding the assigned names and the status. The mirror is filled by a single
+values_batch_get over all worksheets, kept current by a periodic sync that
+only rewrites the rows that changed, and patched with the bot's own writes
+as soon as they are flushed. Query functions never touch the Sheets API, but
+they do block on SQLite, so callers on the event loop run them in a thread.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import database
+import spreadsheet
+
+logger = logging.getLogger(__name__)
+
+SYNC_INTERVAL = float(os.getenv("MIRROR_SYNC_INTERVAL", "300"))
+# Rows 1-3 hold the title and the task headers.
+FIRST_CHAPTER_ROW = 4
+
+# sheet title -> {task key: (label, name_cols, status_col)} from the last sync
+_layouts: dict[str, dict[str, tuple[str, list[int], int]]] = {}
+_write_lock = threading.Lock()
+_read_lock = threading.Lock()
+_last_sync: float | None = None
+# Writes happen on Sheets threads and reads on worker threads, each on its own connection.
+_write_conn: sqlite3.Connection | None = None
+_read_conn: sqlite3.Connection | None = None
+
+
+def init():
+    """Open the mirror connections and create the MIRROR table. Safe to call repeatedly."""
+    global _write_conn, _read_conn
+    if _read_conn is not None:
+        return
+    with _write_lock:
+        if _read_conn is not None:
+            return
+        _write_conn = database.connect()
+        _write_conn.execute(
+            "CREATE TABLE IF NOT EXISTS MIRROR ("
+            "sheet_title TEXT, chapter TEXT, task TEXT, label TEXT, row_idx INTEGER, names TEXT, status TEXT, "
+            "PRIMARY KEY (sheet_title, chapter, task))"
+        )
+        _write_conn.execute("CREATE INDEX IF NOT EXISTS MIRROR_ROW ON MIRROR (sheet_title, row_idx)")
+        _write_conn.commit()
+        read_conn = database.connect()
+        # SQLite's lower() only folds ASCII, so names are matched with Python's casefold().
+        read_conn.create_function("casefold", 1, lambda text: text.casefold() if text is not None else None, deterministic=True)
+        # Published last: other threads skip init() once it is set.
+        _read_conn = read_conn
+
+
+def _sheet_layout(rows: list[list[str]]) -> dict[str, tuple[str, list[int], int]]:
+    header_row = rows[1] if len(rows) > 1 else []
+    sub_headers = rows[2] if len(rows) > 2 else []
+    labels = {}
+    for label in header_row:
+        labels.setdefault(str(label).strip().lower(), str(label).strip())
+    return {
+        key: (labels.get(key, key), name_cols, status_col)
+        for key, (name_cols, status_col) in spreadsheet.parse_task_layout(header_row, sub_headers).items()
+    }
+
+
+def _flatten(rows: list[list[str]], layout: dict[str, tuple[str, list[int], int]]) -> dict[tuple[str, str], tuple]:
+    """(chapter, task) -> (label, row_idx, names json, status) for every chapter row."""
+    flat = {}
+    for row_idx, row in enumerate(rows[FIRST_CHAPTER_ROW - 1:], start=FIRST_CHAPTER_ROW):
+        chapter = spreadsheet.normalize_chapter(row[0]) if row else ""
+        if not chapter:
+            continue
+        for key, (label, name_cols, status_col) in layout.items():
+            names = [str(row[col - 1]).strip() if col <= len(row) else "" for col in name_cols]
+            status = str(row[status_col - 1]).strip() if status_col <= len(row) else ""
+            flat.setdefault((chapter, key), (label, row_idx, json.dumps(names, ensure_ascii=False), status))
+    return flat
+
+
+def sync() -> dict:
+    """
+    Read every worksheet in one request and apply the differences to the mirror.
+    Blocking; run it on the Sheets executor. Returns worksheet and row counts.
+    """
+    global _last_sync
+    init()
+    titles = spreadsheet.get_all_worksheet_titles()
+    contents = spreadsheet.read_worksheets(titles)
+    changed = removed = 0
+    with _write_lock:
+        for title, rows in contents.items():
+            layout = _sheet_layout(rows)
+            if not layout:
+                continue
+            _layouts[title] = layout
+            fresh = _flatten(rows, layout)
+            current = {
+                (chapter, task): (label, row_idx, names, status)
+                for chapter, task, label, row_idx, names, status in _write_conn.execute(
+                    "SELECT chapter, task, label, row_idx, names, status FROM MIRROR WHERE sheet_title = ?", (title,)
+                )
+            }
+            upserts = [(title, chapter, task, *values) for (chapter, task), values in fresh.items() if current.get((chapter, task)) != values]
+            deletes = [(title, chapter, task) for (chapter, task) in current.keys() - fresh.keys()]
+            _write_conn.executemany("INSERT OR REPLACE INTO MIRROR VALUES (?, ?, ?, ?, ?, ?, ?)", upserts)
+            _write_conn.executemany("DELETE FROM MIRROR WHERE sheet_title = ? AND chapter = ? AND task = ?", deletes)
+            changed += len(upserts)
+            removed += len(deletes)
+        for title in set(_layouts) - set(contents):
+            _layouts.pop(title, None)
+            removed += _write_conn.execute("DELETE FROM MIRROR WHERE sheet_title = ?", (title,)).rowcount
+        _write_conn.commit()
+    _last_sync = time.monotonic()
+    logger.info('Mirror sync of %s worksheets: %s rows changed, %s removed', len(contents), changed, removed)
+    return {"worksheets": len(contents), "changed": changed, "removed": removed}
+
+
+def apply_cells(sheet_title: str, cells: list[tuple[int, int, str]]):
+    """Patch the mirror with (row, col, value) cells the bot just wrote to `sheet_title`."""
+    layout = _layouts.get(sheet_title)
+    if not layout or not cells:
+        return
+    init()
+    targets = {}
+    for key, (_, name_cols, status_col) in layout.items():
+        for slot, col in enumerate(name_cols):
+            targets[col] = (key, slot)
+        targets[status_col] = (key, None)
+    with _write_lock:
+        for row_idx, col, value in cells:
+            if col not in targets:
+                continue
+            key, slot = targets[col]
+            found = _write_conn.execute(
+                "SELECT chapter, names FROM MIRROR WHERE sheet_title = ? AND row_idx = ? AND task = ?",
+                (sheet_title, row_idx, key),
+            ).fetchone()
+            if found is None:
+                # Row not mirrored yet; the next sync picks it up.
+                continue
+            chapter, names = found
+            if slot is None:
+                _write_conn.execute(
+                    "UPDATE MIRROR SET status = ? WHERE sheet_title = ? AND chapter = ? AND task = ?",
+                    (str(value).strip(), sheet_title, chapter, key),
+                )
+            else:
+                names = json.loads(names)
+                names[slot] = str(value).strip()
+                _write_conn.execute(
+                    "UPDATE MIRROR SET names = ? WHERE sheet_title = ? AND chapter = ? AND task = ?",
+                    (json.dumps(names, ensure_ascii=False), sheet_title, chapter, key),
+                )
+        _write_conn.commit()
+
+
+def _read(sql: str, params: tuple) -> list[tuple]:
+    init()
+    with _read_lock:
+        return _read_conn.execute(sql, params).fetchall()
+
+
+def last_sync_age() -> float | None:
+    """Seconds since the last completed sync, or None if the mirror was never synced."""
+    return None if _last_sync is None else time.monotonic() - _last_sync
+
+
+def resolve_series(name: str) -> str|None:
+    """Worksheet title for a saved alias or a case-insensitive mirrored title."""
+    sheet_title = database.get_series_by_name(name)
+    if sheet_title:
+        return sheet_title
+    found = _read("SELECT DISTINCT sheet_title FROM MIRROR WHERE casefold(sheet_title) = ? LIMIT 1", (name.strip().casefold(),))
+    return found[0][0] if found else None
+
+
+def _entry(label: str, chapter: str, names: str, status: str) -> dict:
+    return {"task": label, "chapter": chapter, "names": [name for name in json.loads(names) if name], "status": status}
+
+
+def chapter_status(sheet_title: str, chapter_value: str) -> list[dict]:
+    """Every task of one chapter, in column order."""
+    columns = list(_layouts.get(sheet_title, {}))
+    rows = _read(
+        "SELECT task, label, chapter, names, status FROM MIRROR WHERE sheet_title = ? AND chapter = ?",
+        (sheet_title, spreadsheet.normalize_chapter(chapter_value)),
+    )
+    rows.sort(key=lambda row: columns.index(row[0]) if row[0] in columns else len(columns))
+    return [_entry(*row[1:]) for row in rows]
+
+
+def _chapter_order(entry: dict):
+    try:
+        return (0, float(entry["chapter"]), entry["task"])
+    except ValueError:
+        return (1, entry["chapter"], entry["task"])
+
+
+def open_tasks(sheet_title: str) -> list[dict]:
+    """Tasks of a series that are not Done, by chapter."""
+    rows = _read(
+        "SELECT label, chapter, names, status FROM MIRROR WHERE sheet_title = ? AND lower(status) != 'done'",
+        (sheet_title,),
+    )
+    return sorted((_entry(*row) for row in rows), key=_chapter_order)
+
+
+def user_assignments(user_name: str) -> list[tuple[str, dict]]:
+    """(sheet title, entry) for every task naming `user_name`, unfinished ones first."""
+    target = user_name.strip().casefold()
+    rows = _read(
+        "SELECT sheet_title, label, chapter, names, status FROM MIRROR WHERE instr(casefold(names), ?) > 0",
+        (target,),
+    )
+    assignments = [
+        (sheet_title, entry)
+        for sheet_title, *values in rows
+        for entry in [_entry(*values)]
+        if any(name.casefold() == target for name in entry["names"])
+    ]
+    return sorted(assignments, key=lambda item: (item[1]["status"].lower() == "done", item[0], _chapter_order(item[1])))
@@ -0,0 +1,359 @@
+"""
+Durable outbox for tracker writes.
+
+Accepted task entries are committed to the OUTBOX table before the author
+gets any answer, and a background drainer applies them to the sheet. Entries
+for the same (sheet, chapter, task) are applied strictly in id order, a
+failed Sheets request is retried with backoff without blocking other cells,
+and re-applying an entry only rewrites the author's own slot, so retries
+after a crash are harmless. Callers wait up to ACK_TIMEOUT seconds for the
+write to land; entries that take longer are reported through the notifier
+once they are applied, including entries left over from a previous run.
+Backfill holds the cells it rewrites, so the drainer leaves them alone
+until it is done.
+"""
+import asyncio
+import collections
+import contextlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, NamedTuple
+
+import google.auth.exceptions
+import gspread
+import requests
+
+import async_sheets
+import database
+import locks
+import metrics
+import mirror
+import sheets_scheduler
+import spreadsheet
+
+logger = logging.getLogger(__name__)
+
+ACK_TIMEOUT = float(os.getenv("OUTBOX_ACK_TIMEOUT", "10"))
+# Most cells applied per pass.
+BATCH = int(os.getenv("OUTBOX_BATCH", "200"))
+RETRY_BASE = float(os.getenv("OUTBOX_RETRY_BASE", "5"))
+RETRY_MAX = float(os.getenv("OUTBOX_RETRY_MAX", "600"))
+# Attempts before an entry that keeps failing with an unexpected error is dropped.
+# Sheets outages and throttling are retried for as long as they last.
+MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+# After a wake-up the drainer waits this long, so a burst of updates is written
+# with one request per worksheet.
+FLUSH_WINDOW_MS = float(os.getenv("SHEETS_FLUSH_WINDOW_MS", "250"))
+
+
+class OutboxItem(NamedTuple):
+    id: int
+    token: str
+    sheet_title: str
+    entry: spreadsheet.TaskEntry
+    channel_id: int | None
+    attempts: int
+    next_attempt: float
+
+
+# token -> future of a caller still waiting for its entry
+_waiters: dict[str, asyncio.Future] = {}
+_wakeup = asyncio.Event()
+_task: asyncio.Task | None = None
+_notifier: Callable[[int | None, str, spreadsheet.TaskEntry, dict], Awaitable[None]] | None = None
+_read_lock = threading.Lock()
+_read_conn: sqlite3.Connection | None = None
+# Stored cell keys held by backfill -> number of holders
+_held: collections.Counter = collections.Counter()
+# Stored cell keys the running pass is applying; _idle is set between passes.
+_in_flight: set[str] = set()
+_idle = asyncio.Event()
+_idle.set()
+
+
+def set_notifier(notifier: Callable[[int | None, str, spreadsheet.TaskEntry, dict], Awaitable[None]]):
+    """Register the coroutine that reports results nobody is waiting for: (channel_id, sheet_title, entry, result)."""
+    global _notifier
+    _notifier = notifier
+
+
+def _query(sql: str, params: tuple = ()) -> list[tuple]:
+    global _read_conn
+    with _read_lock:
+        if _read_conn is None:
+            database.init()
+            _read_conn = database.connect()
+        return _read_conn.execute(sql, params).fetchall()
+
+
+def _stored_key(key: tuple) -> str:
+    return json.dumps(key, ensure_ascii=False)
+
+
+def _cell_key(sheet_title: str, entry: spreadsheet.TaskEntry) -> str:
+    """Stored form of the entry's lock key; entries sharing it are applied in id order."""
+    return _stored_key(locks.task_key(sheet_title, spreadsheet.normalize_chapter(entry.chapter_value), entry.task))
+
+
+def pending_count() -> int:
+    return _query("SELECT COUNT(*) FROM OUTBOX")[0][0]
+
+
+async def submit(sheet_title: str, entries: list[spreadsheet.TaskEntry], channel_id: int | None = None) -> list[dict]:
+    """
+    Commit `entries` to the outbox and wait up to ACK_TIMEOUT seconds for them
+    to be applied. Entries still pending after that get {"queued": True}.
+    """
+    loop = asyncio.get_running_loop()
+    tokens = [uuid.uuid4().hex for _ in entries]
+    futures = {token: loop.create_future() for token in tokens}
+    _waiters.update(futures)
+    now = time.time()
+    try:
+        with metrics.timer("outbox_commit"):
+            await asyncio.gather(*(
+                asyncio.wrap_future(database.submit(
+                    "INSERT OR IGNORE INTO OUTBOX (token, sheet_title, chapter, task, user_name, status, replace, replace_col, "
+                    "channel_id, created_at, attempts, next_attempt, cell_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, ?, ?)",
+                    (token, sheet_title, str(entry.chapter_value), entry.task, entry.user_name, entry.status,
+                     int(entry.replace), entry.replace_col, channel_id, now, now, _cell_key(sheet_title, entry)),
+                ))
+                for token, entry in zip(tokens, entries)
+            ))
+    except BaseException:
+        for token in tokens:
+            _waiters.pop(token, None)
+        raise
+    _wakeup.set()
+    await asyncio.wait(futures.values(), timeout=ACK_TIMEOUT)
+    results = []
+    for token in tokens:
+        future = futures[token]
+        if future.done():
+            results.append(future.result())
+        else:
+            # The drainer reports it through the notifier once it lands.
+            _waiters.pop(token, None)
+            results.append({"success": False, "queued": True})
+    return results
+
+
+@contextlib.asynccontextmanager
+async def hold(keys):
+    """
+    Keep the drainer off the cells of `keys` (locks.task_key tuples) for the
+    block, once a pass already applying any of them has finished. Entries for
+    those cells stay queued until the block exits.
+    """
+    cell_keys = {_stored_key(key) for key in keys}
+    _held.update(cell_keys)
+    try:
+        while _in_flight & cell_keys:
+            await _idle.wait()
+        yield
+    finally:
+        _held.subtract(cell_keys)
+        for cell_key in cell_keys:
+            if _held[cell_key] <= 0:
+                del _held[cell_key]
+        _wakeup.set()
+
+
+# The oldest entry of every cell that is not held; only these may be applied.
+_HEADS = "SELECT MIN(id) FROM OUTBOX WHERE coalesce(cell_key, '') NOT IN (SELECT value FROM json_each(?)) GROUP BY cell_key"
+
+
+def _load_due(now: float, held: str) -> list[OutboxItem]:
+    """The oldest due heads, so cells that are backing off never hide the others."""
+    rows = _query(
+        "SELECT id, token, sheet_title, chapter, task, user_name, status, replace, replace_col, channel_id, attempts, next_attempt "
+        f"FROM OUTBOX WHERE id IN ({_HEADS}) AND next_attempt <= ? ORDER BY id LIMIT ?",
+        (held, now, BATCH),
+    )
+    return [
+        OutboxItem(id, token, sheet_title, spreadsheet.TaskEntry(chapter, task, user_name, status, bool(replace), replace_col), channel_id, attempts, next_attempt)
+        for id, token, sheet_title, chapter, task, user_name, status, replace, replace_col, channel_id, attempts, next_attempt in rows
+    ]
+
+
+# Sheets unreachable or too slow; the entries themselves are fine.
+_TRANSPORT_ERRORS = (asyncio.TimeoutError, requests.RequestException, OSError, google.auth.exceptions.TransportError)
+
+
+def _next_attempt(held: str) -> float | None:
+    return _query(f"SELECT MIN(next_attempt) FROM OUTBOX WHERE id IN ({_HEADS})", (held,))[0][0]
+
+
+def _is_transient(error: gspread.exceptions.APIError) -> bool:
+    code = sheets_scheduler.status_code(error)
+    return code is None or code == 429 or code >= 500
+
+
+async def _report(item: OutboxItem, result: dict):
+    waiter = _waiters.pop(item.token, None)
+    if waiter is not None:
+        if not waiter.done():
+            waiter.set_result(result)
+        return
+    if _notifier is not None:
+        try:
+            await _notifier(item.channel_id, item.sheet_title, item.entry, result)
+        except Exception as e:
+            logger.error('Failed to report outbox entry %s: %r', item.id, e)
+
+
+async def _retry(items: list[OutboxItem], error: Exception):
+    now = time.time()
+    await asyncio.gather(*(
+        asyncio.wrap_future(database.submit(
+            "UPDATE OUTBOX SET attempts = ?, next_attempt = ? WHERE id = ?",
+            (item.attempts + 1, now + min(RETRY_BASE * 2 ** item.attempts, RETRY_MAX), item.id),
+        ))
+        for item in items
+    ))
+    metrics.increment("outbox_retries", len(items))
+    logger.warning('Deferred %s outbox entries for "%s" after %r', len(items), items[0].sheet_title, error)
+
+
+async def _delete(items: list[OutboxItem]):
+    await asyncio.gather(*(asyncio.wrap_future(database.submit("DELETE FROM OUTBOX WHERE id = ?", (item.id,))) for item in items))
+
+
+async def _retry_or_drop(items: list[OutboxItem], error: Exception):
+    """Defer entries after an unexpected error, or drop and report those out of attempts."""
+    exhausted = [item for item in items if item.attempts + 1 >= MAX_ATTEMPTS]
+    remaining = [item for item in items if item.attempts + 1 < MAX_ATTEMPTS]
+    if remaining:
+        await _retry(remaining, error)
+    if not exhausted:
+        return
+    logger.error('Dropping %s outbox entries for "%s" after %s attempts: %r', len(exhausted), exhausted[0].sheet_title, MAX_ATTEMPTS, error)
+    metrics.increment("outbox_dropped", len(exhausted))
+    await _delete(exhausted)
+    for item in exhausted:
+        await _report(item, {"success": False, "error": "Something went wrong while writing it to the sheet. Please post it again."})
+
+
+async def _apply(sheet_title: str, items: list[OutboxItem], refreshed: bool = False):
+    """
+    Prepare and write `items` of one worksheet with one request each. A rejected
+    request is re-prepared once against fresh caches, then split in halves, so
+    only the entries it was actually rejected for fail; unexpected errors are
+    split the same way.
+    """
+    entries = [item.entry for item in items]
+    try:
+        # The drainer runs outside any update's trace, so its requests are attributed to the entries here.
+        # No call timeout: an abandoned worker could still write after a later
+        # entry for the same cell. Each HTTP request is bounded by SHEETS_HTTP_TIMEOUT.
+        with metrics.count_calls("outbox.api_calls_per_entry", len(items)):
+            results = await async_sheets.run(spreadsheet.prepare_task_entries_by_title, sheet_title, entries, timeout=None)
+            cells = [cell for result in results if result.get("success") for cell in result.pop("cells")]
+            if cells:
+                await async_sheets.run(spreadsheet.write_cells, sheet_title, cells, timeout=None)
+        if cells:
+            try:
+                await asyncio.to_thread(mirror.apply_cells, sheet_title, cells)
+            except Exception as e:
+                logger.error('Failed to apply outbox cells of "%s" to the mirror: %r', sheet_title, e)
+    except gspread.exceptions.APIError as e:
+        if _is_transient(e):
+            await _retry(items, e)
+            return
+        if not refreshed:
+            # write_cells dropped the cached layout and metadata; the columns may have moved.
+            logger.warning('Google Sheets rejected %s outbox entries for "%s", preparing them again: %s', len(items), sheet_title, e)
+            await _apply(sheet_title, items, refreshed=True)
+            return
+        if len(items) > 1:
+            middle = len(items) // 2
+            await _apply(sheet_title, items[:middle], refreshed=True)
+            await _apply(sheet_title, items[middle:], refreshed=True)
+            return
+        logger.error('Google Sheets rejected %s outbox entries for "%s": %s', len(items), sheet_title, e)
+        results = [{"success": False, "error": async_sheets.describe_api_error(e)} for _ in items]
+    except _TRANSPORT_ERRORS as e:
+        await _retry(items, e)
+        return
+    except Exception as e:
+        if len(items) > 1:
+            # Keep one bad entry from holding back the rest of the worksheet.
+            middle = len(items) // 2
+            await _apply(sheet_title, items[:middle], refreshed)
+            await _apply(sheet_title, items[middle:], refreshed)
+            return
+        logger.error('Failed to apply outbox entry %s for "%s": %r', items[0].id, sheet_title, e)
+        await _retry_or_drop(items, e)
+        return
+    await _delete(items)
+    for item, result in zip(items, results):
+        if result.get("success"):
+            logger.info('Updated "%s" ch%s %s: %s [%s]', sheet_title, item.entry.chapter_value, item.entry.task, item.entry.user_name, item.entry.status)
+        await _report(item, result)
+
+
+async def drain() -> float | None:
+    """
+    Apply every due entry that is first in line for its cell. Returns when the
+    next pass is due (a time.time() value), or None if the outbox is empty.
+    """
+    due = await asyncio.to_thread(_load_due, time.time(), json.dumps(list(_held), ensure_ascii=False))
+    # A hold may have started while the query ran.
+    keys = {item.id: _cell_key(item.sheet_title, item.entry) for item in due}
+    due = [item for item in due if keys[item.id] not in _held]
+    if not due:
+        # Empty, or every cell waits on a deferred or held entry.
+        return await asyncio.to_thread(_next_attempt, json.dumps(list(_held), ensure_ascii=False))
+    by_sheet: dict[str, list[OutboxItem]] = {}
+    for item in due:
+        by_sheet.setdefault(item.sheet_title, []).append(item)
+    logger.debug('Draining %s outbox entries across %s worksheets', len(due), len(by_sheet))
+    _in_flight.update(keys[item.id] for item in due)
+    _idle.clear()
+    try:
+        # Wait for every worksheet, even if one fails, so passes never overlap.
+        outcomes = await asyncio.gather(*(_apply(sheet_title, sheet_items) for sheet_title, sheet_items in by_sheet.items()), return_exceptions=True)
+    finally:
+        _in_flight.clear()
+        _idle.set()
+    for (sheet_title, sheet_items), outcome in zip(by_sheet.items(), outcomes):
+        if isinstance(outcome, Exception):
+            logger.error('Outbox pass for "%s" failed: %r', sheet_title, outcome)
+            try:
+                await _retry_or_drop(sheet_items, outcome)
+            except Exception as e:
+                logger.error('Failed to defer outbox entries for "%s": %r', sheet_title, e)
+    # Entries queued behind this pass's heads may be due now.
+    return time.time()
+
+
+async def _drain_forever():
+    while True:
+        _wakeup.clear()
+        try:
+            next_pass = await drain()
+        except Exception as e:
+            logger.error('Outbox drain failed: %r', e)
+            next_pass = time.time() + RETRY_BASE
+        timeout = None if next_pass is None else max(0.0, next_pass - time.time())
+        if not _wakeup.is_set():
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                # Deferred or queued-behind entries are due; nothing new arrived.
+                continue
+        await asyncio.sleep(FLUSH_WINDOW_MS / 1000)
+
+
+def start() -> asyncio.Task:
+    """Start the drainer on the running loop, unless it already runs."""
+    global _task
+    if _task is None:
+        _task = asyncio.create_task(_drain_forever())
+        logger.info('Outbox drainer started')
+    return _task
@@ -0,0 +1,75 @@
+"""
+Routing of replies to pending interactive prompts.
+
+A prompt waits for the next message of one author in one channel. Pending
+prompts are kept in a FIFO per (channel_id, author_id), so on_message hands a
+reply to exactly one prompt with a dict lookup instead of running a
+wait_for check per prompt, and a consumed reply is never parsed as a status
+update. Prompts expire after their timeout, and each author may only have a
+few outstanding at once.
+"""
+import asyncio
+import collections
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+MAX_PER_USER = int(os.getenv("PROMPTS_MAX_PER_USER", "3"))
+
+
+class TooManyPrompts(Exception):
+    """The author already has MAX_PER_USER prompts waiting for a reply."""
+
+
+class PromptDispatcher:
+    def __init__(self, max_per_user: int = MAX_PER_USER):
+        self.max_per_user = max_per_user
+        # (channel_id, author_id) -> futures of the waiting prompts, oldest first
+        self._pending: dict[tuple[int, int], collections.deque] = {}
+        self._per_user: collections.Counter = collections.Counter()
+
+    async def ask(self, channel_id: int, author_id: int, timeout: float):
+        """
+        Wait for the author's next message in the channel and return it.
+        Raises asyncio.TimeoutError when the prompt expires, or TooManyPrompts
+        when the author is at the cap.
+        """
+        if self.full(author_id):
+            raise TooManyPrompts(author_id)
+        key = (channel_id, author_id)
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(key, collections.deque()).append(future)
+        self._per_user[author_id] += 1
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            waiting = self._pending.get(key)
+            if waiting is not None:
+                if future in waiting:
+                    waiting.remove(future)
+                if not waiting:
+                    del self._pending[key]
+            self._per_user[author_id] -= 1
+            if self._per_user[author_id] <= 0:
+                del self._per_user[author_id]
+
+    def full(self, author_id: int) -> bool:
+        return self._per_user[author_id] >= self.max_per_user
+
+    def dispatch(self, message) -> bool:
+        """Give `message` to the oldest prompt waiting on its author and channel. Returns True if one took it."""
+        waiting = self._pending.get((message.channel.id, message.author.id))
+        while waiting:
+            future = waiting.popleft()
+            if not future.done():
+                future.set_result(message)
+                logger.debug('Routed message %s to a pending prompt', message.id)
+                return True
+        return False
+
+    def __len__(self) -> int:
+        return sum(self._per_user.values())
+
+
+dispatcher = PromptDispatcher()
@@ -0,0 +1,200 @@
+"""
+Quota-aware scheduler for Google Sheets API requests.
+
+Every request made by the spreadsheet module goes through here. Reads and
+writes draw from separate token buckets sized to the per-minute quota,
+waiting callers are served by priority lane (user-facing before background),
+and 429/5xx responses are retried with jittered exponential backoff.
+"""
+import contextlib
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+
+import gspread
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+READ = "read"
+WRITE = "write"
+
+# Priority lanes, lowest value is served first.
+USER = 0
+BACKGROUND = 1
+LANE_NAMES = {USER: "user", BACKGROUND: "background"}
+
+READS_PER_MINUTE = float(os.getenv("SHEETS_READS_PER_MINUTE", "60"))
+WRITES_PER_MINUTE = float(os.getenv("SHEETS_WRITES_PER_MINUTE", "60"))
+BURST = float(os.getenv("SHEETS_BURST", "10"))
+MAX_RETRIES = int(os.getenv("SHEETS_MAX_RETRIES", "5"))
+BACKOFF_BASE = float(os.getenv("SHEETS_BACKOFF_BASE", "1"))
+BACKOFF_MAX = float(os.getenv("SHEETS_BACKOFF_MAX", "32"))
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_priority = contextvars.ContextVar("sheets_priority", default=USER)
+
+
+@contextlib.contextmanager
+def priority(level: int):
+    """Run the Sheets requests made inside the block in the given priority lane."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def status_code(error: gspread.exceptions.APIError) -> int | None:
+    """HTTP status of an APIError, across gspread versions."""
+    code = getattr(error, "code", None)
+    if code is None:
+        code = getattr(getattr(error, "response", None), "status_code", None)
+    return code
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `rate_per_minute`, holding at most `capacity` tokens."""
+
+    def __init__(self, rate_per_minute: float, capacity: float):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """Seconds until a token is available (0 if one is available now)."""
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def drain(self):
+        """Empty the bucket, e.g. after Google reported the quota as exhausted."""
+        self._refill()
+        self.tokens = min(self.tokens, 0)
+
+
+class RequestScheduler:
+    def __init__(self, reads_per_minute: float, writes_per_minute: float, burst: float, max_retries: int, backoff_base: float, backoff_max: float):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._cond = threading.Condition()
+        self._buckets = {
+            READ: TokenBucket(reads_per_minute, burst),
+            WRITE: TokenBucket(writes_per_minute, burst),
+        }
+        self._waiting: dict[str, list[tuple[int, int]]] = {READ: [], WRITE: []}
+        self._seq = itertools.count()
+        self._counters = {
+            "requests": {READ: 0, WRITE: 0},
+            "throttled": {READ: 0, WRITE: 0},
+            "server_errors": {READ: 0, WRITE: 0},
+            "retries": {READ: 0, WRITE: 0},
+            "failures": {READ: 0, WRITE: 0},
+            "wait_seconds": {READ: 0.0, WRITE: 0.0},
+        }
+
+    def _acquire(self, kind: str, lane: int):
+        """Block until a token of `kind` is granted to this caller, highest priority first."""
+        started = time.monotonic()
+        waiting = self._waiting[kind]
+        bucket = self._buckets[kind]
+        with self._cond:
+            ticket = (lane, next(self._seq))
+            heapq.heappush(waiting, ticket)
+            while True:
+                if waiting[0] == ticket:
+                    delay = bucket.wait_time()
+                    if delay <= 0:
+                        heapq.heappop(waiting)
+                        bucket.take()
+                        self._counters["wait_seconds"][kind] += time.monotonic() - started
+                        self._cond.notify_all()
+                        return
+                    self._cond.wait(delay)
+                else:
+                    self._cond.wait()
+
+    def call(self, kind: str, func, *args, **kwargs):
+        """
+        Make one Sheets request through the `kind` bucket, in the caller's priority lane.
+        Retries on 429/5xx with jittered exponential backoff, re-raising the last
+        APIError once the retries are used up.
+        """
+        lane = _priority.get()
+        name = getattr(func, "__name__", str(func))
+        with metrics.timer(f"sheets.{name}"):
+            return self._call(kind, lane, name, func, *args, **kwargs)
+
+    def _call(self, kind: str, lane: int, name: str, func, *args, **kwargs):
+        attempt = 0
+        while True:
+            self._acquire(kind, lane)
+            with self._cond:
+                self._counters["requests"][kind] += 1
+            metrics.count_api_call(kind)
+            try:
+                return func(*args, **kwargs)
+            except gspread.exceptions.APIError as e:
+                code = status_code(e)
+                if code not in RETRY_STATUS_CODES:
+                    raise
+                with self._cond:
+                    if code == 429:
+                        self._counters["throttled"][kind] += 1
+                        # Slow everyone down, not just this caller.
+                        self._buckets[kind].drain()
+                    else:
+                        self._counters["server_errors"][kind] += 1
+                    if attempt >= self.max_retries:
+                        self._counters["failures"][kind] += 1
+                        logger.error('Sheets %s %s failed with %s after %s retries', kind, name, code, attempt)
+                        raise
+                    self._counters["retries"][kind] += 1
+                delay = min(self.backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.0)
+                logger.warning('Sheets %s %s got %s, retrying in %.1fs', kind, name, code, delay)
+                attempt += 1
+                time.sleep(delay)
+
+    def stats(self) -> dict:
+        """Queue depth per bucket and lane, plus request/throttle counters."""
+        with self._cond:
+            queued = {
+                kind: {name: sum(1 for lane, _ in waiting if lane == level) for level, name in LANE_NAMES.items()}
+                for kind, waiting in self._waiting.items()
+            }
+            tokens = {kind: round(bucket.tokens, 2) for kind, bucket in self._buckets.items()}
+            counters = {name: dict(values) for name, values in self._counters.items()}
+        return {"queued": queued, "tokens": tokens, **counters}
+
+
+scheduler = RequestScheduler(READS_PER_MINUTE, WRITES_PER_MINUTE, BURST, MAX_RETRIES, BACKOFF_BASE, BACKOFF_MAX)
+
+
+def read(func, *args, **kwargs):
+    return scheduler.call(READ, func, *args, **kwargs)
+
+
+def write(func, *args, **kwargs):
+    return scheduler.call(WRITE, func, *args, **kwargs)
+
+
+def stats() -> dict:
+    return scheduler.stats()
@@ -1,112 +1,420 @@
 """
 Module for accessing and manipulating spreadsheet data.
+Every Sheets API request goes through sheets_scheduler.
 """
 import gspread
 import logging 
+import os
+import threading
+import time
+from decimal import Decimal, InvalidOperation
+from typing import NamedTuple
+
+import metrics
+import sheets_scheduler
 
 logger = logging.getLogger(__name__)
 
+LAYOUT_TTL = float(os.getenv("SHEETS_LAYOUT_TTL", "3600"))
+# Minimum age before a lookup for an unknown task forces a header re-read.
+LAYOUT_MIN_REFRESH = float(os.getenv("SHEETS_LAYOUT_MIN_REFRESH", "30"))
+CHAPTER_INDEX_TTL = float(os.getenv("SHEETS_CHAPTER_INDEX_TTL", "3600"))
+# Minimum age before a lookup for an unknown chapter forces a full column A re-read.
+CHAPTER_MIN_REFRESH = float(os.getenv("SHEETS_CHAPTER_MIN_REFRESH", "30"))
+METADATA_TTL = float(os.getenv("SHEETS_METADATA_TTL", "600"))
+# Minimum age before a lookup for an unknown worksheet forces a metadata re-fetch.
+METADATA_MIN_REFRESH = float(os.getenv("SHEETS_METADATA_MIN_REFRESH", "10"))
+# Ranges per spreadsheet-wide bulk write request.
+BULK_WRITE_RANGES = int(os.getenv("SHEETS_BULK_WRITE_RANGES", "500"))
+# Seconds one HTTP request may take, so calls run without an overall timeout still return.
+HTTP_TIMEOUT = float(os.getenv("SHEETS_HTTP_TIMEOUT", "60"))
+
 spreadsheet_id = "1C4nokf-Ip-lFMm6j9Al64kI1m5kOHEfTUBNv25gALlo"
-gc = gspread.service_account(filename="credentials.json")
-sh = gc.open_by_key(spreadsheet_id)
+
+_connect_lock = threading.Lock()
+_spreadsheet: gspread.Spreadsheet | None = None
+
+def connect() -> gspread.Spreadsheet:
+    """Authorize and open the tracker spreadsheet on first use; later calls return the same handle."""
+    global _spreadsheet
+    if _spreadsheet is not None:
+        return _spreadsheet
+    with _connect_lock:
+        if _spreadsheet is None:
+            gc = gspread.service_account(filename="credentials.json")
+            gc.set_timeout(HTTP_TIMEOUT)
+            _spreadsheet = sheets_scheduler.read(gc.open_by_key, spreadsheet_id)
+            logger.info('Connected to spreadsheet %s', spreadsheet_id)
+    return _spreadsheet
+
+# Serializes metadata re-fetches so concurrent cold lookups share one request.
+_refresh_lock = threading.Lock()
+_metadata_lock = threading.Lock()
+# Worksheet handles by title, worksheet titles by gid, and when they were fetched.
+_metadata: dict = {"worksheets": {}, "gids": {}, "loaded_at": None}
+_layout_lock = threading.Lock()
+_layouts: dict[str, tuple[float, dict[str, tuple[list[int], int]]]] = {}
+_chapter_lock = threading.Lock()
+_chapter_indexes: dict[str, dict] = {}
+
+def refresh_metadata():
+    """Re-fetch the spreadsheet metadata (one request) and rebuild the worksheet cache."""
+    worksheets = sheets_scheduler.read(connect().worksheets)
+    with _metadata_lock:
+        _metadata["worksheets"] = {ws.title: ws for ws in worksheets}
+        _metadata["gids"] = {ws.id: ws.title for ws in worksheets}
+        _metadata["loaded_at"] = time.monotonic()
+    logger.debug('Loaded metadata for %s worksheets', len(worksheets))
+
+def _metadata_age() -> float | None:
+    with _metadata_lock:
+        loaded_at = _metadata["loaded_at"]
+    return None if loaded_at is None else time.monotonic() - loaded_at
+
+def _ensure_metadata(min_age: float = METADATA_TTL):
+    """Refresh the metadata if it is at least `min_age` old, unless another thread just did."""
+    with _refresh_lock:
+        age = _metadata_age()
+        if age is None or age >= min_age:
+            refresh_metadata()
+
+def invalidate_metadata():
+    with _metadata_lock:
+        _metadata["loaded_at"] = None
+
+def get_worksheet(sheet_title: str) -> gspread.Worksheet:
+    """
+    Return the cached Worksheet for `sheet_title`. An unknown title triggers one
+    metadata refresh before raising gspread.WorksheetNotFound.
+    """
+    age = _metadata_age()
+    fresh = age is not None and age < METADATA_TTL
+    metrics.cache_lookup("worksheet_metadata", fresh)
+    if not fresh:
+        _ensure_metadata()
+        age = 0.0
+    with _metadata_lock:
+        ws = _metadata["worksheets"].get(sheet_title)
+    if ws is None and age > METADATA_MIN_REFRESH:
+        _ensure_metadata(METADATA_MIN_REFRESH)
+        with _metadata_lock:
+            ws = _metadata["worksheets"].get(sheet_title)
+    if ws is None:
+        raise gspread.WorksheetNotFound(sheet_title)
+    return ws
 
 def worksheet_exists(sheet_title: str) -> bool:
     try:
-        result = sh.worksheet(sheet_title) is not None
-        logger.debug(f'Worksheet "{sheet_title}" exists: {result}')
+        result = get_worksheet(sheet_title) is not None
+        logger.debug('Worksheet "%s" exists: %s', sheet_title, result)
         return result
     except gspread.WorksheetNotFound:
-        logger.warning(f'Worksheet "{sheet_title}" not found')
+        logger.warning('Worksheet "%s" not found', sheet_title)
         return False
 
-def _find_task_start_col_case_insensitive(labels: list[str], task: str) -> int | None:
-    target = str(task).strip().lower()
-    for idx, label in enumerate(labels, start=1):
-        if str(label).strip().lower() == target:
-            return idx
-    return None
-
-def get_task_columns_by_title(sheet_title: str, task: str) -> tuple[list[int], int] | None:
-    logger.debug(f'Looking for task "{task}" columns in "{sheet_title}"')
-    ws = sh.worksheet(sheet_title)
-    header_row = ws.row_values(2)
-    if not header_row:
-        logger.warning(f'No header row found in "{sheet_title}"')
-        return None
-    start_col = _find_task_start_col_case_insensitive(header_row, task)
-    if start_col is None:
-        logger.warning(f'Task "{task}" not found in header row of "{sheet_title}"')
-        return None
-    logger.debug(f'Task "{task}" starts at column {start_col}')
-    sub_headers = ws.row_values(3)
-    
+def _parse_task_columns(header_row: list[str], sub_headers: list[str], start_col: int) -> tuple[list[int], int] | None:
+    """Find the Name/Status columns of the task whose header starts at `start_col`."""
     next_task_col = None
     for idx in range(start_col, len(header_row)):
         if idx > start_col - 1 and header_row[idx].strip():
             next_task_col = idx + 1
-            logger.debug(f'Next task section starts at column {next_task_col}')
             break
-    
+
     if next_task_col is None:
         next_task_col = len(sub_headers) + 1
-        logger.debug(f'No next task found, scanning until end of headers')
-    
+
     name_cols = []
     status_col = None
-    
+
     for col_idx in range(start_col, next_task_col):
         if col_idx > len(sub_headers):
             break
         cell_label = sub_headers[col_idx - 1] if len(sub_headers) >= col_idx else ""
         cell_lower = str(cell_label).strip().lower()
-        
+
         if cell_lower == "name" or (not cell_label.strip() and len(name_cols) > 0 and status_col is None):
             name_cols.append(col_idx)
-            logger.debug(f'Found name column at {col_idx}: "{cell_label}"')
         elif cell_lower == "status":
             status_col = col_idx
-            logger.debug(f'Found status column at {col_idx}')
             break
-    
+
     if not name_cols or status_col is None:
-        logger.error(f'Could not find Name/Status columns for task "{task}" in "{sheet_title}". Found name_cols={name_cols}, status_col={status_col}')
-        logger.debug(f'Sub-headers from col {start_col} to {next_task_col}: {sub_headers[start_col-1:next_task_col-1]}')
         return None
-    
-    logger.info(f'Task "{task}" in "{sheet_title}": name_cols={name_cols}, status_col={status_col}')
     return (name_cols, status_col)
 
+def parse_task_layout(header_row: list[str], sub_headers: list[str]) -> dict[str, tuple[list[int], int]]:
+    """
+    Map every task label in header row 2 (lowercased) to its (name_cols, status_col),
+    using the Name/Status sub-headers in row 3. The first occurrence of a label wins.
+    """
+    layout = {}
+    for start_col, label in enumerate(header_row, start=1):
+        key = str(label).strip().lower()
+        if not key or key in layout:
+            continue
+        cols = _parse_task_columns(header_row, sub_headers, start_col)
+        if cols is None:
+            logger.debug('Header "%s" at column %s has no Name/Status sub-headers', label, start_col)
+            continue
+        layout[key] = cols
+    return layout
+
+def _load_task_layout(sheet_title: str) -> dict[str, tuple[list[int], int]]:
+    ws = get_worksheet(sheet_title)
+    rows = sheets_scheduler.read(ws.get, "2:3")
+    header_row = rows[0] if len(rows) > 0 else []
+    sub_headers = rows[1] if len(rows) > 1 else []
+    if not header_row:
+        logger.warning('No header row found in "%s"', sheet_title)
+    layout = parse_task_layout(header_row, sub_headers)
+    logger.info('Loaded task layout for "%s": %s', sheet_title, layout)
+    return layout
+
+def _get_task_layout(sheet_title: str, refresh: bool = False) -> tuple[dict[str, tuple[list[int], int]], float]:
+    """Return the cached task layout of a worksheet and its age in seconds, reloading it if stale."""
+    with _layout_lock:
+        cached = _layouts.get(sheet_title)
+    now = time.monotonic()
+    if cached is not None and not refresh and now - cached[0] < LAYOUT_TTL:
+        metrics.cache_lookup("task_layout", True)
+        return cached[1], now - cached[0]
+    metrics.cache_lookup("task_layout", False)
+    layout = _load_task_layout(sheet_title)
+    with _layout_lock:
+        _layouts[sheet_title] = (time.monotonic(), layout)
+    return layout, 0.0
+
+def warm_task_layouts(sheet_titles: list[str]):
+    """Load the task layouts of several worksheets with one values_batch_get request."""
+    if not sheet_titles:
+        return
+    ranges = [gspread.utils.absolute_range_name(title, "2:3") for title in sheet_titles]
+    response = sheets_scheduler.read(connect().values_batch_get, ranges)
+    loaded_at = time.monotonic()
+    layouts = {}
+    for title, value_range in zip(sheet_titles, response.get("valueRanges", [])):
+        rows = value_range.get("values", [])
+        layouts[title] = (loaded_at, parse_task_layout(rows[0] if rows else [], rows[1] if len(rows) > 1 else []))
+    with _layout_lock:
+        _layouts.update(layouts)
+    logger.info('Warmed task layouts for %s worksheets', len(layouts))
+
+def invalidate_task_layout(sheet_title: str | None = None):
+    """Drop the cached task layout of `sheet_title`, or of every worksheet if None."""
+    with _layout_lock:
+        if sheet_title is None:
+            _layouts.clear()
+        else:
+            _layouts.pop(sheet_title, None)
+    logger.info('Invalidated task layout cache for %s', sheet_title or "all worksheets")
+
+def get_task_columns_by_title(sheet_title: str, task: str) -> tuple[list[int], int] | None:
+    logger.debug('Looking for task "%s" columns in "%s"', task, sheet_title)
+    key = str(task).strip().lower()
+    layout, age = _get_task_layout(sheet_title)
+    cols = layout.get(key)
+    if cols is None and age > LAYOUT_MIN_REFRESH:
+        # The task may have been added since the layout was cached.
+        layout, age = _get_task_layout(sheet_title, refresh=True)
+        cols = layout.get(key)
+    if cols is None:
+        logger.warning('Task "%s" not found in header rows of "%s"', task, sheet_title)
+        return None
+    name_cols, status_col = cols
+    logger.debug('Task "%s" in "%s": name_cols=%s, status_col=%s', task, sheet_title, name_cols, status_col)
+    return (list(name_cols), status_col)
+
+def normalize_chapter(chapter_value: str | int | float) -> str:
+    """Canonical form of a chapter number, so "12", "12.0" and "012" all map to "12"."""
+    text = str(chapter_value).strip()
+    try:
+        number = Decimal(text)
+    except InvalidOperation:
+        return text
+    if not number.is_finite():
+        return text
+    return format(number.normalize(), "f")
+
+def _refresh_chapter_index(sheet_title: str, full: bool = False):
+    """
+    Read column A into the chapter index of `sheet_title`. Unless `full` is set
+    (or the index is missing/stale), only rows past the last known chapter are read.
+    """
+    with _chapter_lock:
+        index = _chapter_indexes.get(sheet_title)
+    if index is not None and time.monotonic() - index["loaded_at"] >= CHAPTER_INDEX_TTL:
+        full = True
+    ws = get_worksheet(sheet_title)
+    if full or index is None:
+        start_row = 1
+        values = sheets_scheduler.read(ws.col_values, 1)
+    else:
+        start_row = index["last_row"] + 1
+        values = [row[0] if row else "" for row in sheets_scheduler.read(ws.get, f"A{start_row}:A")]
+
+    with _chapter_lock:
+        if full or sheet_title not in _chapter_indexes:
+            index = {"rows": {}, "last_row": 0, "loaded_at": time.monotonic()}
+            _chapter_indexes[sheet_title] = index
+        else:
+            index = _chapter_indexes[sheet_title]
+        for row_idx, val in enumerate(values, start=start_row):
+            key = normalize_chapter(val)
+            if not key:
+                continue
+            index["rows"].setdefault(key, row_idx)
+            index["last_row"] = max(index["last_row"], row_idx)
+    logger.debug('Chapter index for "%s" read %s rows from row %s', sheet_title, len(values), start_row)
+
+def invalidate_chapter_index(sheet_title: str | None = None):
+    """Drop the chapter index of `sheet_title`, or of every worksheet if None."""
+    with _chapter_lock:
+        if sheet_title is None:
+            _chapter_indexes.clear()
+        else:
+            _chapter_indexes.pop(sheet_title, None)
+
 def find_row_by_chapter_by_title(sheet_title: str, chapter_value: str | int | float) -> int | None:
-    ws = sh.worksheet(sheet_title)
-    col_a = ws.col_values(1)
-    target = str(chapter_value).strip()
-    for idx, val in enumerate(col_a, start=1):
-        if str(val).strip() == target:
-            return idx
-    return None
-
-def update_task_entry_by_title(sheet_title: str, chapter_value: str | int | float, task: str, user_name: str, status: str, replace: bool = False, replace_col: int | None = None) -> dict:
+    target = normalize_chapter(chapter_value)
+    with _chapter_lock:
+        index = _chapter_indexes.get(sheet_title)
+        row_idx = index["rows"].get(target) if index is not None else None
+    metrics.cache_lookup("chapter_index", row_idx is not None)
+    if row_idx is not None:
+        return row_idx
+    # Unknown chapter: pick up rows appended since the last read.
+    _refresh_chapter_index(sheet_title)
+    with _chapter_lock:
+        index = _chapter_indexes[sheet_title]
+        row_idx = index["rows"].get(target)
+        age = time.monotonic() - index["loaded_at"]
+    if row_idx is None and age > CHAPTER_MIN_REFRESH:
+        # The chapter may have been inserted above the last known row.
+        _refresh_chapter_index(sheet_title, full=True)
+        with _chapter_lock:
+            row_idx = _chapter_indexes[sheet_title]["rows"].get(target)
+    return row_idx
+
+def invalidate_caches(sheet_title: str | None = None):
+    """Drop every cached structure for `sheet_title`, or for all worksheets if None."""
+    invalidate_metadata()
+    invalidate_task_layout(sheet_title)
+    invalidate_chapter_index(sheet_title)
+
+def write_cells(sheet_title: str, cells: list[tuple[int, int, str]]):
+    """Write (row, col, value) cells to a worksheet with a single batch_update request."""
+    if not cells:
+        return
+    ws = get_worksheet(sheet_title)
+    data = [
+        {"range": gspread.utils.rowcol_to_a1(row, col), "values": [[value]]}
+        for row, col, value in cells
+    ]
     try:
-        ws = sh.worksheet(sheet_title)
-    except gspread.WorksheetNotFound:
-        logger.error(f'Worksheet "{sheet_title}" not found')
-        return {"success": False, "error": "Worksheet not found"}
-    row_idx = find_row_by_chapter_by_title(sheet_title, chapter_value)
+        sheets_scheduler.write(ws.batch_update, data, value_input_option="USER_ENTERED")
+    except gspread.exceptions.APIError:
+        # A rejected write usually means the columns or the worksheet itself
+        # changed under the cached layout and metadata.
+        invalidate_task_layout(sheet_title)
+        invalidate_metadata()
+        raise
+    logger.debug('Wrote %s cells to "%s"', len(cells), sheet_title)
+
+def write_sheet_cells(cells_by_sheet: dict[str, list[tuple[int, int, str]]], chunk: int = BULK_WRITE_RANGES) -> int:
+    """
+    Write (row, col, value) cells across several worksheets with spreadsheet-wide
+    values_batch_update requests of at most `chunk` ranges. Returns the request count.
+    """
+    data = [
+        {"range": gspread.utils.absolute_range_name(title, gspread.utils.rowcol_to_a1(row, col)), "values": [[value]]}
+        for title, cells in cells_by_sheet.items()
+        for row, col, value in cells
+    ]
+    requests = 0
+    for start in range(0, len(data), chunk):
+        try:
+            sheets_scheduler.write(connect().values_batch_update, {"valueInputOption": "USER_ENTERED", "data": data[start:start + chunk]})
+        except gspread.exceptions.APIError:
+            invalidate_caches()
+            raise
+        requests += 1
+    logger.info('Wrote %s cells to %s worksheets in %s requests', len(data), len(cells_by_sheet), requests)
+    return requests
+
+class TaskEntry(NamedTuple):
+    chapter_value: str | int | float
+    task: str
+    user_name: str
+    status: str
+    replace: bool = False
+    replace_col: int | None = None
+
+def _span_bounds(name_cols: list[int], status_col: int) -> tuple[int, int]:
+    return min(name_cols), max(name_cols + [status_col])
+
+def _read_task_spans(ws, targets: list[tuple[int, list[int], int]]) -> list[tuple[str, dict[int, str]]]:
+    """
+    Read the name_cols..status_col span of each (row_idx, name_cols, status_col)
+    target, plus the row's chapter cell in column A, all in a single request.
+    Returns a (chapter cell, column -> value map) pair per target.
+    """
+    if not targets:
+        return []
+    ranges = []
+    for row_idx, name_cols, status_col in targets:
+        first_col, last_col = _span_bounds(name_cols, status_col)
+        ranges.append(f"A{row_idx}")
+        ranges.append(f"{gspread.utils.rowcol_to_a1(row_idx, first_col)}:{gspread.utils.rowcol_to_a1(row_idx, last_col)}")
+    value_ranges = sheets_scheduler.read(ws.batch_get, ranges)
+    spans = []
+    for i, (row_idx, name_cols, status_col) in enumerate(targets):
+        chapter_range, span_range = value_ranges[2 * i], value_ranges[2 * i + 1]
+        first_col, last_col = _span_bounds(name_cols, status_col)
+        chapter_cell = chapter_range[0][0] if chapter_range and chapter_range[0] else ""
+        span_values = span_range[0] if span_range else []
+        row_values = {
+            col: span_values[col - first_col] if col - first_col < len(span_values) else ""
+            for col in range(first_col, last_col + 1)
+        }
+        spans.append((chapter_cell, row_values))
+    return spans
+
+def _locate_entry(sheet_title: str, entry: TaskEntry) -> tuple[int, list[int], int] | dict:
+    """Return the (row_idx, name_cols, status_col) of an entry, or an error result."""
+    ws = get_worksheet(sheet_title)
+    row_idx = find_row_by_chapter_by_title(sheet_title, entry.chapter_value)
     if row_idx is None:
-        logger.error(f'Chapter {chapter_value} not found in "{sheet_title}"')
+        logger.error('Chapter %s not found in "%s"', entry.chapter_value, sheet_title)
         return {"success": False, "error": "Chapter not found"}
-    cols = get_task_columns_by_title(sheet_title, task)
+    cols = get_task_columns_by_title(sheet_title, entry.task)
+    if cols is not None and max(cols[0] + [cols[1]]) > ws.col_count:
+        # The cached layout points past the end of the sheet, so the headers
+        # or the grid size changed.
+        logger.warning('Cached columns %s for "%s" exceed the %s columns of "%s", refreshing layout', cols, entry.task, ws.col_count, sheet_title)
+        invalidate_task_layout(sheet_title)
+        refresh_metadata()
+        cols = get_task_columns_by_title(sheet_title, entry.task)
     if cols is None:
-        logger.error(f'Task "{task}" columns not found in "{sheet_title}"')
+        logger.error('Task "%s" columns not found in "%s"', entry.task, sheet_title)
         return {"success": False, "error": "Task columns not found"}
     name_cols, status_col = cols
-    
+    return (row_idx, name_cols, status_col)
+
+def _decide_entry(sheet_title: str, entry: TaskEntry, row_idx: int, name_cols: list[int], status_col: int, row_values: dict[int, str]) -> dict:
+    """Pick the name slot for an entry from its row buffer, or describe the collision."""
+    chapter_value, task, user_name, status = entry.chapter_value, entry.task, entry.user_name, entry.status
+    own_col = next((col for col in name_cols if str(row_values[col]).strip().lower() == str(user_name).strip().lower()), None)
+    if own_col is not None:
+        # The user already holds a slot (an earlier status, or a retried write),
+        # so only their status changes.
+        logger.debug('Prepared "%s" ch%s %s: %s [%s] in own slot at column %s', sheet_title, chapter_value, task, user_name, status, own_col)
+        return {"success": True, "column": own_col, "cells": [(row_idx, own_col, user_name), (row_idx, status_col, status)]}
     if len(name_cols) == 1:
         target_col = name_cols[0]
-        existing_name = ws.cell(row_idx, target_col).value
+        existing_name = row_values[target_col]
         if existing_name and str(existing_name).strip():
-            if not replace:
-                logger.warning(f'Single name column at ch{chapter_value} {task} is occupied by "{existing_name}"')
+            if not entry.replace:
+                logger.warning('Single name column at ch%s %s is occupied by "%s"', chapter_value, task, existing_name)
                 return {
                     "success": False,
                     "collision": True,
@@ -114,27 +422,21 @@ def update_task_entry_by_title(sheet_title: str, chapter_value: str | int | floa
                     "replace_col": target_col,
                     "message": f"This task is already assigned to {existing_name}. Would you like to replace them?"
                 }
-        ws.update_cell(row_idx, target_col, user_name)
-        ws.update_cell(row_idx, status_col, status)
-        logger.info(f'Updated "{sheet_title}" ch{chapter_value} {task}: {user_name} [{status}]')
-        return {"success": True}
+        logger.debug('Prepared "%s" ch%s %s: %s [%s]', sheet_title, chapter_value, task, user_name, status)
+        return {"success": True, "cells": [(row_idx, target_col, user_name), (row_idx, status_col, status)]}
     else:
         target_col = None
         for col in name_cols:
-            cell_value = ws.cell(row_idx, col).value
+            cell_value = row_values[col]
             if not cell_value or not str(cell_value).strip():
                 target_col = col
-                logger.debug(f'Found empty name slot at column {col}')
+                logger.debug('Found empty name slot at column %s', col)
                 break
-        
+
         if target_col is None:
-            occupied_names = []
-            for col in name_cols:
-                cell_value = ws.cell(row_idx, col).value
-                if cell_value and str(cell_value).strip():
-                    occupied_names.append(str(cell_value).strip())
-            logger.warning(f'All name columns for ch{chapter_value} {task} are occupied: {occupied_names}')
-            if not replace:
+            occupied_names = [str(row_values[col]).strip() for col in name_cols if str(row_values[col]).strip()]
+            logger.warning('All name columns for ch%s %s are occupied: %s', chapter_value, task, occupied_names)
+            if not entry.replace:
                 return {
                     "success": False,
                     "collision": True,
@@ -142,14 +444,66 @@ def update_task_entry_by_title(sheet_title: str, chapter_value: str | int | floa
                     "replace_col": name_cols[0],
                     "message": f"All slots are occupied by: {', '.join(occupied_names)}. Replace the first entry?"
                 }
-            target_col = replace_col if replace_col is not None else name_cols[0]
-        
-        ws.update_cell(row_idx, target_col, user_name)
-        ws.update_cell(row_idx, status_col, status)
-        logger.info(f'Updated "{sheet_title}" ch{chapter_value} {task}: {user_name} [{status}] at column {target_col}')
-        return {"success": True, "column": target_col}
+            target_col = entry.replace_col if entry.replace_col is not None else name_cols[0]
+
+        logger.debug('Prepared "%s" ch%s %s: %s [%s] at column %s', sheet_title, chapter_value, task, user_name, status, target_col)
+        return {"success": True, "column": target_col, "cells": [(row_idx, target_col, user_name), (row_idx, status_col, status)]}
+
+def prepare_task_entries_by_title(sheet_title: str, entries: list[TaskEntry]) -> list[dict]:
+    """
+    Resolve where each task entry goes without writing anything. The rows of all
+    entries are read in one request. Each result carries the (row, col, value)
+    `cells` to write on success, or describes the error or name collision.
+    """
+    try:
+        ws = get_worksheet(sheet_title)
+    except gspread.WorksheetNotFound:
+        logger.error('Worksheet "%s" not found', sheet_title)
+        return [{"success": False, "error": "Worksheet not found"} for _ in entries]
+
+    results: list[dict | None] = [None] * len(entries)
+    pending = list(range(len(entries)))
+    for attempt in range(2):
+        located = {}
+        for i in pending:
+            location = _locate_entry(sheet_title, entries[i])
+            if isinstance(location, dict):
+                results[i] = location
+            else:
+                located[i] = location
+        ws = get_worksheet(sheet_title)
+        spans = _read_task_spans(ws, list(located.values()))
+        stale = []
+        for i, (chapter_cell, row_values) in zip(located, spans):
+            row_idx, name_cols, status_col = located[i]
+            if normalize_chapter(chapter_cell) != normalize_chapter(entries[i].chapter_value):
+                stale.append(i)
+                continue
+            results[i] = _decide_entry(sheet_title, entries[i], row_idx, name_cols, status_col, row_values)
+        if not stale:
+            break
+        # Rows were inserted or removed since the chapter index was built.
+        logger.warning('Chapter index of "%s" is out of date for rows %s; rebuilding it', sheet_title, [located[i][0] for i in stale])
+        invalidate_chapter_index(sheet_title)
+        pending = stale
+    for i in range(len(entries)):
+        if results[i] is None:
+            logger.error('Chapter %s not found in "%s"', entries[i].chapter_value, sheet_title)
+            results[i] = {"success": False, "error": "Chapter not found"}
+    return results
+
+def read_worksheets(sheet_titles: list[str]) -> dict[str, list[list[str]]]:
+    """Read the full contents of several worksheets with one values_batch_get request."""
+    if not sheet_titles:
+        return {}
+    ranges = [gspread.utils.absolute_range_name(title) for title in sheet_titles]
+    response = sheets_scheduler.read(connect().values_batch_get, ranges)
+    value_ranges = response.get("valueRanges", [])
+    return {title: value_range.get("values", []) for title, value_range in zip(sheet_titles, value_ranges)}
 
 def get_all_worksheet_titles() -> list[str]:
-    titles = [ws.title for ws in sh.worksheets()]
-    logger.debug(f'All worksheet titles: {titles}')
+    _ensure_metadata()
+    with _metadata_lock:
+        titles = list(_metadata["worksheets"])
+    logger.debug('All worksheet titles: %s', titles)
     return titles
\ No newline at end of file
@@ -0,0 +1,86 @@
+"""
+Background warm-up after the gateway connects.
+
+The database and the Google Sheets client are opened off the event loop
+once on_ready fires, and the worksheet metadata, task layouts and alias
+index are loaded concurrently before the outbox drainer starts. Messages
+that arrive earlier wait on `ready` in arrival order instead of failing.
+"""
+import asyncio
+import logging
+import os
+import time
+
+import alias_index
+import async_sheets
+import database
+import mirror
+import outbox
+import sheets_scheduler
+import spreadsheet
+
+logger = logging.getLogger(__name__)
+
+# Delay between connection attempts, doubling up to the maximum.
+RETRY_DELAY = float(os.getenv("STARTUP_RETRY_DELAY", "5"))
+RETRY_DELAY_MAX = float(os.getenv("STARTUP_RETRY_DELAY_MAX", "300"))
+
+ready = asyncio.Event()
+_task: asyncio.Task | None = None
+
+
+async def _connect():
+    delay = RETRY_DELAY
+    while True:
+        try:
+            await asyncio.gather(
+                asyncio.to_thread(database.init),
+                asyncio.to_thread(mirror.init),
+                async_sheets.run(spreadsheet.connect, priority=sheets_scheduler.BACKGROUND),
+            )
+            return
+        except Exception as e:
+            logger.error('Startup connection failed, retrying in %.0fs: %r', delay, e)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RETRY_DELAY_MAX)
+
+
+async def _warm_caches():
+    titles = await async_sheets.run(spreadsheet.get_all_worksheet_titles, priority=sheets_scheduler.BACKGROUND)
+    results = await asyncio.gather(
+        async_sheets.run(spreadsheet.warm_task_layouts, titles, priority=sheets_scheduler.BACKGROUND),
+        asyncio.to_thread(alias_index.get_index, titles, database.get_all_series()),
+        return_exceptions=True,
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            # Cold caches only cost extra requests on the first updates.
+            logger.warning('Cache warm-up step failed: %r', result)
+
+
+async def warm_up():
+    """Connect, warm the caches and release queued messages. Runs once."""
+    started = time.monotonic()
+    await _connect()
+    try:
+        await _warm_caches()
+    except Exception as e:
+        logger.warning('Cache warm-up failed: %r', e)
+    # Entries left over from a previous run are applied first, in order.
+    outbox.start()
+    ready.set()
+    logger.info('Startup warm-up finished in %.1fs', time.monotonic() - started)
+
+
+def start() -> asyncio.Task:
+    """Schedule the warm-up on the running loop, unless it already started."""
+    global _task
+    if _task is None:
+        _task = asyncio.create_task(warm_up())
+    return _task
+
+
+async def wait_ready():
+    """Return once the warm-up finished; callers queue in arrival order until then."""
+    if not ready.is_set():
+        await ready.wait()
@@ -0,0 +1,65 @@
+"""
+Parser for status update messages.
+
+A message holds one update per line, e.g. "Tower of God ch 42 TL Done", and a
+line may cover a chapter range ("ch 40-43 TL Done") of at most MAX_RANGE whole
+chapters; longer or decimal ranges are reported back. Messages that cannot
+contain an update are rejected with plain string checks before any regex runs.
+"""
+import re
+
+STATUSES = ("done", "working", "help")
+# Longest chapter range accepted on one line.
+MAX_RANGE = 25
+
+_status_line = re.compile(
+    r"(?i)^(.+?)\s+ch\s*(\d+(?:\.\d+)?)(?:\s*-\s*(\d+(?:\.\d+)?))?\s+([A-Za-z]+)\s+(Done|Working|Help)$"
+)
+
+
+def _might_match(lowered: str) -> bool:
+    return "ch" in lowered and lowered.rstrip().endswith(STATUSES)
+
+
+def _expand_chapters(start: str, end: str | None) -> list[str] | None:
+    if end is None:
+        return [start]
+    if "." in start or "." in end:
+        return None
+    first, last = int(start), int(end)
+    if last < first or last - first >= MAX_RANGE:
+        return None
+    return [str(chapter) for chapter in range(first, last + 1)]
+
+
+def parse(content: str, rejected: list[str] | None = None) -> list[dict]:
+    """
+    Return the status updates in a message, one dict per chapter with the keys
+    "Name", "Chapter Number", "Task" and "Status". Lines that are not updates
+    are ignored; update lines whose chapter range is too long or not whole
+    chapters are skipped and appended to `rejected` if given.
+    """
+    lowered = content.lower()
+    if "ch" not in lowered or not any(status in lowered for status in STATUSES):
+        return []
+    updates = []
+    for line in content.splitlines():
+        if not _might_match(line.lower()):
+            continue
+        match = _status_line.match(" ".join(line.split()))
+        if not match:
+            continue
+        name, start, end, task, status = match.groups()
+        chapters = _expand_chapters(start, end)
+        if chapters is None:
+            if rejected is not None:
+                rejected.append(line.strip())
+            continue
+        for chapter_number in chapters:
+            updates.append({
+                "Name": name,
+                "Chapter Number": chapter_number,
+                "Task": task,
+                "Status": status.capitalize(),
+            })
+    return updates
@@ -1,51 +1,69 @@
 import discord
-import spreadsheet, database
+import gspread
+import alias_index, async_sheets, database, locks, metrics, outbox, prompts, spreadsheet
 from bot_instance import bot
 import asyncio
 import logging
-from thefuzz import fuzz
+import sqlite3
 logger = logging.getLogger(__name__)
 
 
+TOO_MANY_PROMPTS = "You already have questions from me waiting for an answer. Please answer those first, then post this update again."
+
 async def get_series_sheet_title(name: str, message) -> str|None:
-        logger.info(f'Requesting worksheet title for unknown series: {name}')
-        sheets = spreadsheet.get_all_worksheet_titles()
-        best_match = None
-        best_score = 0
-        for s in sheets:
-            score = fuzz.token_sort_ratio(name.lower(), s.lower())
-            if score > best_score:
-                best_score = score
-                best_match = s
-
-        suggested = best_match if best_match and best_score >= 70 else None
+        logger.info('Requesting worksheet title for unknown series: %s', name)
+        if prompts.dispatcher.full(message.author.id):
+            logger.warning('Too many pending prompts for %s', message.author)
+            await message.channel.send(TOO_MANY_PROMPTS)
+            return
+        try:
+            sheets = await async_sheets.get_all_worksheet_titles()
+        except asyncio.TimeoutError:
+            logger.error('Timed out fetching worksheet titles for %s', name)
+            await message.channel.send("Google Sheets took too long to respond. Please try again later.")
+            return
+        except gspread.exceptions.APIError as e:
+            logger.error('Failed to fetch worksheet titles for %s: %s', name, e)
+            await message.channel.send(async_sheets.describe_api_error(e))
+            return
+        suggestions = alias_index.suggest(name, sheets, database.get_all_series())
 
         class ConfirmView(discord.ui.View):
-            def __init__(self, requester_id: int):
+            def __init__(self, requester_id: int, options: list[str]):
                 super().__init__(timeout=60)
                 self.chosen_title: str | None = None
                 self.requester_id = requester_id
+                for idx, title in enumerate(options):
+                    button = discord.ui.Button(
+                        label=title[:80],
+                        style=discord.ButtonStyle.success if idx == 0 else discord.ButtonStyle.primary,
+                    )
+                    button.callback = self._choose(title)
+                    self.add_item(button)
+                none_button = discord.ui.Button(label="None of these", style=discord.ButtonStyle.secondary)
+                none_button.callback = self._none
+                self.add_item(none_button)
 
             async def interaction_check(self, interaction: discord.Interaction) -> bool:
                 return interaction.user.id == self.requester_id
 
-            @discord.ui.button(label="Yes", style=discord.ButtonStyle.success)
-            async def yes(self, button: discord.ui.Button, interaction: discord.Interaction):
-                if suggested:
-                    self.chosen_title = suggested
-                await interaction.response.send_message("Using suggested sheet.", ephemeral=True)
-                self.stop()
+            def _choose(self, title: str):
+                async def callback(interaction: discord.Interaction):
+                    self.chosen_title = title
+                    await interaction.response.send_message(f"Using '{title}'.", ephemeral=True)
+                    self.stop()
+                return callback
 
-            @discord.ui.button(label="No", style=discord.ButtonStyle.secondary)
-            async def no(self, button: discord.ui.Button, interaction: discord.Interaction):
+            async def _none(self, interaction: discord.Interaction):
                 await interaction.response.send_message("Please type the correct worksheet title.", ephemeral=True)
                 self.stop()
 
-        view = ConfirmView(message.author.id) if suggested else None
+        view = ConfirmView(message.author.id, suggestions) if suggestions else None
 
-        if suggested:
+        if suggestions:
+            options = ", ".join(f"'{title}'" for title in suggestions)
             await message.channel.send(
-                f"I don't recognize '{name}'. Did you mean '{suggested}'? Click Yes to confirm, or type the correct worksheet title (case-sensitive).",
+                f"I don't recognize '{name}'. Did you mean {options}? Click one to confirm, or type the correct worksheet title (case-sensitive).",
                 view=view,
             )
         else:
@@ -53,159 +71,245 @@ async def get_series_sheet_title(name: str, message) -> str|None:
                 f"I don't recognize '{name}'. Please reply with the worksheet title for this series (case-sensitive as in Sheets)."
             )
 
-        def check_msg(m):
-            return m.author == message.author and m.channel == message.channel
-
         chosen_title: str | None = None
         try:
             if view:
-                await view.wait()
+                with metrics.timer("prompt_wait"):
+                    await view.wait()
                 if view.chosen_title:
                     chosen_title = view.chosen_title
-                    if not spreadsheet.worksheet_exists(chosen_title):
-                        logger.warning(f'Suggested worksheet not found: {chosen_title}')
+                    if not await async_sheets.worksheet_exists(chosen_title):
+                        logger.warning('Suggested worksheet not found: %s', chosen_title)
                         await message.channel.send("I couldn't find that worksheet title. Please type the correct one.")
                         chosen_title = None
 
             if not chosen_title:
                 try:
-                    reply = await bot.wait_for("message", check=check_msg, timeout=60)
+                    with metrics.timer("prompt_wait"):
+                        reply = await prompts.dispatcher.ask(message.channel.id, message.author.id, timeout=60)
                     sheet_title = reply.content.strip()
                     if not sheet_title:
-                        logger.warning(f'Empty title provided by {message.author}')
+                        logger.warning('Empty title provided by %s', message.author)
                         await message.channel.send("Empty title provided. Aborting.")
                         return
-                    if not spreadsheet.worksheet_exists(sheet_title):
-                        logger.warning(f'Invalid worksheet title provided: {sheet_title}')
+                    if not await async_sheets.worksheet_exists(sheet_title):
+                        logger.warning('Invalid worksheet title provided: %s', sheet_title)
                         await message.channel.send("I couldn't find a worksheet with that title. Please check and try again next time.")
                         return
                     chosen_title = sheet_title
                 except asyncio.TimeoutError:
-                    logger.warning(f'Timeout waiting for worksheet title for {name}')
+                    logger.warning('Timeout waiting for worksheet title for %s', name)
                     await message.channel.send("Timed out waiting for sheet title.")
                     return
+                except prompts.TooManyPrompts:
+                    logger.warning('Too many pending prompts for %s', message.author)
+                    await message.channel.send(TOO_MANY_PROMPTS)
+                    return
 
             database.add_series(chosen_title, name)
-            logger.info(f'Saved new series alias: {name} -> {chosen_title}')
+            logger.info('Saved new series alias: %s -> %s', name, chosen_title)
             await message.channel.send(
                 f"Saved alias: '{name}' → worksheet '{chosen_title}'."
             )
             return chosen_title
         except asyncio.TimeoutError:
-            logger.warning(f'Timeout waiting for worksheet title for {name}')
+            logger.warning('Timeout waiting for worksheet title for %s', name)
             await message.channel.send("Timed out waiting for sheet title.")
             return
 
 async def get_user_scanname(name: str, message) -> str|None:
-    scanname = database.get_user_scannname(name)
+    with metrics.timer("scanname_lookup"):
+        scanname = database.get_user_scannname(name)
+    metrics.cache_lookup("scanname", scanname is not None)
     if not scanname:
-        logger.info(f'Requesting scanname for unknown user: {name}')
+        logger.info('Requesting scanname for unknown user: %s', name)
+        if prompts.dispatcher.full(message.author.id):
+            logger.warning('Too many pending prompts for %s', message.author)
+            await message.channel.send(TOO_MANY_PROMPTS)
+            return None
         await message.channel.send(
             f"I don't have a scanname for '{name}'. Please reply with the scanname to use."
         )
 
-        def check(m):
-            return (
-                m.author == message.author
-                and m.channel == message.channel
-            )
-
         try:
-            reply = await bot.wait_for("message", check=check, timeout=60)
+            with metrics.timer("prompt_wait"):
+                reply = await prompts.dispatcher.ask(message.channel.id, message.author.id, timeout=60)
             scanname = reply.content.strip()
             if not scanname:
-                logger.warning(f'Empty scanname provided by {message.author}')
+                logger.warning('Empty scanname provided by %s', message.author)
                 await message.channel.send("Empty scanname provided. Aborting.")
                 return None
 
             database.add_user(name, scanname)
-            logger.info(f'Saved new user scanname: {name} -> {scanname}')
+            logger.info('Saved new user scanname: %s -> %s', name, scanname)
             await message.channel.send(
                 f"Saved scanname for '{name}': '{scanname}'."
             )
         except asyncio.TimeoutError:
-            logger.warning(f'Timeout waiting for scanname for {name}')
+            logger.warning('Timeout waiting for scanname for %s', name)
             await message.channel.send("Timed out waiting for scanname.")
             return None
+        except prompts.TooManyPrompts:
+            logger.warning('Too many pending prompts for %s', message.author)
+            await message.channel.send(TOO_MANY_PROMPTS)
+            return None
     return scanname
         
-async def update_tracker(data: dict, message):
+async def _send_lines(channel, lines: list[str], limit: int = 2000):
+    """Send lines in as few messages as Discord's length limit allows."""
+    chunk = ""
+    for line in lines:
+        if chunk and len(chunk) + len(line) + 1 > limit:
+            with metrics.timer("reply"):
+                await channel.send(chunk)
+            chunk = ""
+        chunk = f"{chunk}\n{line}" if chunk else line
+    if chunk:
+        with metrics.timer("reply"):
+            await channel.send(chunk)
+
+async def _resolve_collision(sheet_title: str, entry: spreadsheet.TaskEntry, result: dict, message) -> bool:
+    """Ask the author whether to replace the occupied slot. Returns True if the entry was written."""
+    chapter_value, task, user_name, status = entry.chapter_value, entry.task, entry.user_name, entry.status
+    logger.warning('Name collision detected: %s', result)
+
+    class ReplaceView(discord.ui.View):
+        def __init__(self, requester_id: int):
+            super().__init__(timeout=30)
+            self.replace = False
+            self.requester_id = requester_id
+
+        async def interaction_check(self, interaction: discord.Interaction) -> bool:
+            return interaction.user.id == self.requester_id
+
+        @discord.ui.button(label="Replace", style=discord.ButtonStyle.danger)
+        async def replace_btn(self, button: discord.ui.Button, interaction: discord.Interaction):
+            self.replace = True
+            await interaction.response.send_message("Replacing entry.", ephemeral=True)
+            self.stop()
+
+        @discord.ui.button(label="Cancel", style=discord.ButtonStyle.secondary)
+        async def cancel_btn(self, button: discord.ui.Button, interaction: discord.Interaction):
+            await interaction.response.send_message("Cancelled.", ephemeral=True)
+            self.stop()
+
+    view = ReplaceView(message.author.id)
+    await message.channel.send(f"Chapter {chapter_value} • {task}: {result.get('message')}", view=view)
+    with metrics.timer("prompt_wait"):
+        await view.wait()
+
+    if not view.replace:
+        await message.channel.send("No changes made.")
+        return False
+
+    force_entry = entry._replace(replace=True, replace_col=result.get("replace_col"))
+    try:
+        force_result = (await outbox.submit(sheet_title, [force_entry], message.channel.id))[0]
+    except sqlite3.Error as e:
+        logger.error('Failed to queue replacement: %s', e)
+        await message.channel.send("I couldn't save the update. Please try again.")
+        return False
+    if force_result.get("queued"):
+        await _send_lines(message.channel, [_queued_line(sheet_title, force_entry)])
+        return False
+    if not force_result.get("success"):
+        logger.error('Failed to replace entry: %s', force_result)
+        await message.channel.send(f"I couldn't update the sheet. {force_result.get('error', 'Please verify the chapter and task.')}")
+        return False
+    logger.info('Replaced entry after collision: %s ch%s %s -> %s [%s]', sheet_title, chapter_value, task, user_name, status)
+    return True
+
+def _queued_line(sheet_title: str, entry: spreadsheet.TaskEntry) -> str:
+    return (f"Queued: {sheet_title} • Chapter {entry.chapter_value} • {entry.task} → {entry.user_name} [{entry.status}]. "
+            "Google Sheets is slow right now; I'll confirm here once it's on the sheet.")
+
+async def _report_queued_result(channel_id: int | None, sheet_title: str, entry: spreadsheet.TaskEntry, result: dict):
+    """Report an outbox entry that was applied after its author stopped waiting."""
+    channel = bot.get_channel(channel_id) if channel_id else None
+    if channel is None:
+        logger.warning('No channel to report queued update for "%s" ch%s %s: %s', sheet_title, entry.chapter_value, entry.task, result)
+        return
+    target = f"{sheet_title} • Chapter {entry.chapter_value} • {entry.task}"
+    if result.get("success"):
+        line = f"Updated: {target} → {entry.user_name} [{entry.status}] (queued earlier)"
+    elif result.get("collision"):
+        holders = result.get("existing_name") or ', '.join(result.get("existing_names", []))
+        line = f"I couldn't apply the queued update for {target}: it is already assigned to {holders}. Post it again to replace them."
+    else:
+        line = f"I couldn't apply the queued update for {target}. {result.get('error', 'Please verify the chapter and task.')}"
+    await _send_lines(channel, [line])
+
+outbox.set_notifier(_report_queued_result)
+
+async def _apply_entries(sheet_title: str, entries: list[spreadsheet.TaskEntry], user_name: str, message):
+    """Queue entries for one worksheet in the outbox, report the results and prompt for collisions."""
+    try:
+        results = await outbox.submit(sheet_title, entries, message.channel.id)
+    except sqlite3.Error as e:
+        logger.error('Failed to queue %s entries for "%s": %s', len(entries), sheet_title, e)
+        await message.channel.send("I couldn't save the update. Please try again.")
+        return
+    lines = []
+    collisions = []
+    updated = 0
+    for entry, result in zip(entries, results):
+        if result.get("success"):
+            updated += 1
+            lines.append(f"Updated: {sheet_title} • Chapter {entry.chapter_value} • {entry.task} → {user_name} [{entry.status}]")
+        elif result.get("collision"):
+            collisions.append((entry, result))
+        elif result.get("queued"):
+            lines.append(_queued_line(sheet_title, entry))
+        else:
+            logger.error('Failed to update sheet: %s ch%s %s - %s', sheet_title, entry.chapter_value, entry.task, result.get("error"))
+            lines.append(f"I couldn't update {sheet_title} • Chapter {entry.chapter_value} • {entry.task}. {result.get('error', 'Please verify the chapter and task.')}")
+    logger.info('Updated %s of %s entries in "%s"', updated, len(entries), sheet_title)
+    await _send_lines(message.channel, lines)
+
+    for entry, result in collisions:
+        if await _resolve_collision(sheet_title, entry, result, message):
+            await _send_lines(message.channel, [f"Updated: {sheet_title} • Chapter {entry.chapter_value} • {entry.task} → {user_name} [{entry.status}]"])
+
+async def update_tracker_batch(updates: list[dict], message):
     """
-    Updates the tracker with the provided data.
-    If the series name is unknown, ask the user for the sheet number
-    and store it using database.add_series().
+    Updates the tracker with every status update parsed from one message.
+    Updates are grouped per worksheet, so each worksheet is read once and
+    written in one flush. If a series name is unknown, ask the user for the
+    sheet title and store it using database.add_series().
     """
-    logger.info(f'Processing tracker update: {data}')
-    sheet_title = database.get_series_by_name(data["Name"]) 
-    if sheet_title is None:
-        sheet_title = await get_series_sheet_title(data["Name"], message)
+    with metrics.trace_update(len(updates)):
+        await _update_tracker_batch(updates, message)
+
+async def _update_tracker_batch(updates: list[dict], message):
+    logger.info('Processing %s tracker updates: %s', len(updates), updates)
+    sheet_titles: dict[str, str] = {}
+    for data in updates:
+        name = data["Name"]
+        if name in sheet_titles:
+            continue
+        with metrics.timer("alias_lookup"):
+            sheet_title = database.get_series_by_name(name)
+        metrics.cache_lookup("series_alias", sheet_title is not None)
         if sheet_title is None:
-            logger.error(f'Failed to resolve sheet title for {data["Name"]}')
-            return
+            sheet_title = await get_series_sheet_title(name, message)
+            if sheet_title is None:
+                logger.error('Failed to resolve sheet title for %s', name)
+                return
+        sheet_titles[name] = sheet_title
     user_name = await get_user_scanname(message.author.name, message)
     if user_name is None:
-        logger.error(f'Failed to resolve scanname for {data["Name"]}')
+        logger.error('Failed to resolve scanname for %s', message.author.name)
         return
-    chapter_value = data.get("Chapter Number")
-    task = data.get("Task")
-    status = data.get("Status")
-
-    result = spreadsheet.update_task_entry_by_title(sheet_title, chapter_value, task, user_name, status)
-    
-    if not result.get("success"):
-        if result.get("collision"):
-            logger.warning(f'Name collision detected: {result}')
-
-            class ReplaceView(discord.ui.View):
-                def __init__(self, requester_id: int):
-                    super().__init__(timeout=30)
-                    self.replace = False
-                    self.requester_id = requester_id
-
-                async def interaction_check(self, interaction: discord.Interaction) -> bool:
-                    return interaction.user.id == self.requester_id
-
-                @discord.ui.button(label="Replace", style=discord.ButtonStyle.danger)
-                async def replace_btn(self, button: discord.ui.Button, interaction: discord.Interaction):
-                    self.replace = True
-                    await interaction.response.send_message("Replacing entry.", ephemeral=True)
-                    self.stop()
-
-                @discord.ui.button(label="Cancel", style=discord.ButtonStyle.secondary)
-                async def cancel_btn(self, button: discord.ui.Button, interaction: discord.Interaction):
-                    await interaction.response.send_message("Cancelled.", ephemeral=True)
-                    self.stop()
-
-            view = ReplaceView(message.author.id)
-            await message.channel.send(result.get("message"), view=view)
-            await view.wait()
 
-            if not view.replace:
-                await message.channel.send("No changes made.")
-                return
+    by_sheet: dict[str, list[spreadsheet.TaskEntry]] = {}
+    for data in updates:
+        entry = spreadsheet.TaskEntry(data["Chapter Number"], data["Task"], user_name, data["Status"])
+        by_sheet.setdefault(sheet_titles[data["Name"]], []).append(entry)
 
-            force_result = spreadsheet.update_task_entry_by_title(
-                sheet_title,
-                chapter_value,
-                task,
-                user_name,
-                status,
-                replace=True,
-                replace_col=result.get("replace_col"),
-            )
-            if not force_result.get("success"):
-                logger.error(f'Failed to replace entry: {force_result}')
-                await message.channel.send(f"I couldn't update the sheet. {force_result.get('error', 'Please verify the chapter and task.')}")
-                return
-            logger.info(f'Replaced entry after collision: {sheet_title} ch{chapter_value} {task} -> {user_name} [{status}]')
-        else:
-            logger.error(f'Failed to update sheet: {sheet_title} ch{chapter_value} {task} - {result.get("error")}')
-            await message.channel.send(f"I couldn't update the sheet. {result.get('error', 'Please verify the chapter and task.')}")
-            return
-    
-    logger.info(f'Successfully updated tracker: {sheet_title} ch{chapter_value} {task} -> {user_name} [{status}]')
-    await message.channel.send(f"Updated: {sheet_title} • Chapter {chapter_value} • {task} → {user_name} [{status}]")
-    return
+    for sheet_title, entries in by_sheet.items():
+        keys = [locks.task_key(sheet_title, spreadsheet.normalize_chapter(entry.chapter_value), entry.task) for entry in entries]
+        # Held from the slot check through any replace prompt to the final write,
+        # so concurrent updates of the same task see each other's results.
+        async with locks.tracker_locks.acquire(*keys):
+            await _apply_entries(sheet_title, entries, user_name, message)
 
-    
-    